@@ -4,43 +4,561 @@ import csv
 import os.path
 from zipfile import *
 import copy 
+import contextlib
 import re
-from chardet.universaldetector import UniversalDetector
+import multiprocessing
+import codecs
+import hashlib
+import pickle
+import gc
+import logging
+import time
 from collections import Counter
+from functools import lru_cache
+from array import array
+from bisect import bisect_left
 
 tokpatt = "([\w][\w\d-]*)([\w][\w]*'ll)|([\w][\w]*'ve)|(it's)|([\w][\w]*'t)|([\w][\w]*'d)|(where's)|(what's)|(she's)|(he's)|([\w][\w]*'re)|(i'm)|(that's)|(let's)|([\w][\w\d-]*)"
+simplepatt = "[\w][\w\d-]*"
+
+logger = logging.getLogger('LIWCtools')
+
+encodingCache = {}
+dictCacheFormat = 'LIWCtools dictionary cache 5'
+tokenCacheFormat = 'LIWCtools token cache 1'
+contentHashCache = {}
+
+def detectEncoding(fileName, sampleSize=1048576):
+    """Returns the encoding of a text file
+    
+    The first sampleSize bytes of the file are decoded as UTF-8; only if that 
+    fails is chardet used (on the same sample). Results are cached by path, 
+    size and modification time of the file.
+    """
+    st = os.stat(fileName)
+    key = (os.path.abspath(fileName),st.st_size,st.st_mtime_ns)
+    if key in encodingCache:
+        return encodingCache[key]
+    with open(fileName,'rb') as f:
+        sample = f.read(sampleSize)
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = 'UTF-8-SIG'
+    else:
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(sample,final=st.st_size <= sampleSize)
+            encoding = 'utf-8'
+        except UnicodeDecodeError:
+            from chardet.universaldetector import UniversalDetector
+            detector = UniversalDetector()
+            detector.feed(sample)
+            detector.close()
+            encoding = detector.result['encoding']
+    encodingCache[key] = encoding
+    return encoding
+
+def freqStrings(values, columns=None):
+    """Returns the rows of a NumPy matrix as lists of numbers formatted for LDictFreq (decimal comma)
+    
+    In the columns where columns (a list of booleans) is False, 0 is written, 
+    as for the relative frequencies in texts without words in a category.
+    """
+    zeroColumns = [] if columns is None else [j for j, c in enumerate(columns) if not c]
+    rows = []
+    for row in values.tolist():
+        strings = [str(x).replace('.',',') for x in row]
+        for j in zeroColumns:
+            strings[j] = '0'
+        rows.append(strings)
+    return rows
+
+def columnSums(v):
+    """Returns the column sums of a (non-empty) 2-d NumPy array, adding the rows one by one
+    
+    The rows are added in order, as in a plain Python loop, so the sums are 
+    exactly those of LDictFreq before it used NumPy; np.sum may add pairwise, 
+    which changes the last digits of the frequencies in its output.
+    """
+    sums = v[0].copy()
+    for row in v[1:]:
+        sums += row
+    return sums
+
+def csrExpand(rows, indptr, indices):
+    """Looks up rows in a CSR matrix (indptr, indices) without values
+    
+    Returns two NumPy arrays with an element for each nonzero in the rows: the 
+    position in rows and the column number. Used to expand word ids into 
+    category numbers.
+    """
+    import numpy as np
+    nnz = indptr[rows + 1] - indptr[rows]
+    pos = np.repeat(np.arange(len(rows)),nnz)
+    first = np.repeat(indptr[rows],nnz)
+    offset = np.arange(len(first)) - np.repeat(np.cumsum(nnz) - nnz,nnz)
+    return pos, indices[first + offset]
+
+@contextlib.contextmanager
+def gcPaused():
+    """Switches off the cyclic garbage collector while many lasting objects are created (e.g. the sets of a dictionary)"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def fileSha1(fileName):
+    """Returns the SHA-1 hex digest of the contents of a file"""
+    h = hashlib.sha1()
+    with open(fileName,'rb') as f:
+        for block in iter(lambda: f.read(1048576),b''):
+            h.update(block)
+    return h.hexdigest()
 
 def mungleWord(word):
     if word[0:1] == "'":
         word = word[1:]
     return word.replace('^',"'").strip()
 
+class LDictTokenizer:
+    """Splits text into lower-cased tokens with a precompiled regular expression
+    
+    By default the pattern is tokpatt (with its groups made non-capturing). 
+    boundary matches the characters that can not be part of a token; texts 
+    may be cut into pieces after such a character without changing the tokens.
+    """
+    def __init__(self, pattern=None, boundary="[^\\w'-]"):
+        """Compiles the pattern (case-insensitive)"""
+        if pattern is None:
+            pattern = re.sub(r'\((?!\?)','(?:',tokpatt)
+        self.pattern = pattern
+        self.regex = re.compile(pattern,flags=re.I)
+        self.boundary = re.compile(boundary)
+    def finditer(self, text):
+        """Returns iterator on the matches in text"""
+        return self.regex.finditer(text)
+    def tokens(self, text):
+        """Returns a list of the lower-cased tokens in text"""
+        if self.regex.groups:
+            return [w.group(0).lower() for w in self.regex.finditer(text)]
+        return list(map(str.lower,self.regex.findall(text)))
+    def settings(self):
+        """Returns a tuple that identifies the tokens produced by the tokenizer (used as part of the key of LDictTokenCache)"""
+        return (type(self).__name__,self.pattern,self.regex.flags,self.boundary.pattern)
+    def lastBoundary(self, text):
+        """Returns the position after the last boundary character in text, 0 if there is none"""
+        i = len(text)
+        while i > 0 and not self.boundary.match(text,i - 1):
+            i -= 1
+        return i
+
+class LDictFastTokenizer(LDictTokenizer):
+    """Tokenizer equivalent to tokpatt that uses a simple pattern for texts without apostrophes
+    
+    All alternatives of tokpatt except the last one need an apostrophe, so a
+    text without apostrophes is tokenized with simplepatt only.
+    """
+    def __init__(self):
+        """Compiles tokpatt and simplepatt"""
+        LDictTokenizer.__init__(self)
+        self.simple = re.compile(simplepatt,flags=re.I)
+    def finditer(self, text):
+        """Returns iterator on the matches in text"""
+        if "'" in text:
+            return self.regex.finditer(text)
+        return self.simple.finditer(text)
+    def tokens(self, text):
+        """Returns a list of the lower-cased tokens in text"""
+        if "'" in text:
+            return list(map(str.lower,self.regex.findall(text)))
+        return list(map(str.lower,self.simple.findall(text)))
+    def settings(self):
+        """Returns a tuple that identifies the tokens produced by the tokenizer (used as part of the key of LDictTokenCache)"""
+        return LDictTokenizer.settings(self) + (self.simple.pattern,)
+
+tokenizerReferenceTexts = [
+    "It's what's left: we'll see, they'd've gone; I'm sure that's it. Let's go, she's here and he's not.",
+    "IT'S WHAT'S LEFT: WE'LL SEE. Where's the co-op's x1-2 and 3-D? Don't won't can't shan't. You're, they're.",
+    "'t Is zo'n mooi huis; m'n broer's auto. Dat's 't. Ëén café, naïve façade, Σίσυφος ΣΊΣΥΦΟΣ, straße STRASSE.",
+    "a-b-c- -abc --x ab'' 'ab' ab'c a'll ab-cd'll ab-cd've I'M i'm_x snake_case 12abc abc12 _x",
+    "Line one\nline two\r\nline three\ttabbed\u00a0nbsp \u2019curly\u2019s are not apostrophes",
+    "",
+    ]
+
+def LDictTokenizerCheck(tokenizer, texts=None):
+    """Checks a tokenizer against the reference tokenization (re.finditer with tokpatt)
+    
+    Uses tokenizerReferenceTexts if no texts are given. Returns a list of 
+    (text number, token number, expected token, found token) for the first 
+    difference in each text that is tokenized differently; an empty list 
+    means that the tokenizer is equivalent on these texts.
+    """
+    if texts is None:
+        texts = tokenizerReferenceTexts
+    diffs = []
+    for i, text in enumerate(texts):
+        expected = [w.group(0).lower() for w in re.finditer(tokpatt,text,flags=re.I)]
+        found = tokenizer.tokens(text)
+        if found != expected:
+            j = 0
+            while j < min(len(found),len(expected)) and found[j] == expected[j]:
+                j += 1
+            diffs.append((i,j,expected[j] if j < len(expected) else None,found[j] if j < len(found) else None))
+    return diffs
+
+class LDictStats:
+    """Counters and per-phase timings of the counting functions
+    
+    counters holds the numbers of files, bytes (of the files), tokens, exact 
+    hits (tokens that are dictionary entries), wildcard hits and misses, and of 
+    files whose tokens were taken from an LDictTokenCache (cached). timings 
+    holds the wall-clock seconds spent per phase: detect (encoding detection), 
+    read, tokenize, lookup and report (adding to the count report). Enable 
+    collection with LDict.LDictInstrument().
+    """
+    counterNames = ('files','bytes','tokens','exact','wildcard','misses','cached')
+    def __init__(self):
+        """Creates zero counters and empty timings"""
+        self.counters = dict.fromkeys(self.counterNames,0)
+        self.timings = {}
+    def add(self, name, n=1):
+        """Increases a counter"""
+        self.counters[name] = self.counters.get(name,0) + n
+    def addTime(self, phase, seconds):
+        """Adds seconds to the timing of a phase"""
+        self.timings[phase] = self.timings.get(phase,0.0) + seconds
+    def addLookups(self, matcher, wcount):
+        """Counts the tokens, exact hits, wildcard hits and misses in a Counter of tokens"""
+        counters = self.counters
+        words = matcher.words
+        for w, n in wcount.items():
+            counters['tokens'] += n
+            if w in words:
+                counters['exact'] += n
+            elif matcher.lookup(w):
+                counters['wildcard'] += n
+            else:
+                counters['misses'] += n
+    def merge(self, other):
+        """Adds the counters and timings of another LDictStats object"""
+        for name, n in other.counters.items():
+            self.add(name,n)
+        for phase, seconds in other.timings.items():
+            self.addTime(phase,seconds)
+    def asDict(self):
+        """Returns the counters and timings as a dict of dicts"""
+        return {'counters':dict(self.counters),'timings':dict(self.timings)}
+    def __repr__(self):
+        return 'LDictStats(' + repr(self.asDict()) + ')'
+
 class LDictText:
     """Text to be analysed for word usage"""
-    def __init__(self, fileName):
+    def __init__(self, fileName, chunkSize=1048576, encoding=None, tokenizer=None, stats=None):
+        """Creates text object for a file
+        
+        The file is tokenized in chunks of about chunkSize characters, or at once 
+        if chunkSize is None. If no encoding is given, it is detected. If an 
+        LDictStats object is given as stats, getTokens adds the file, its size 
+        and the time spent detecting, reading and tokenizing to it.
+        """
         self.fileName = fileName
-        self.detector = UniversalDetector()
+        self.chunkSize = chunkSize
+        self.encoding = encoding
+        if tokenizer is None:
+            tokenizer = LDictTokenizer()
+        self.tokenizer = tokenizer
+        self.stats = stats
+    def getEncoding(self):
+        """Returns the encoding of the file, detecting it if none was given"""
+        if self.encoding is not None:
+            return self.encoding
+        if self.stats is None:
+            return detectEncoding(self.fileName)
+        t = time.perf_counter()
+        encoding = detectEncoding(self.fileName)
+        self.stats.addTime('detect',time.perf_counter() - t)
+        return encoding
+    def getPieces(self, encoding=None):
+        """Generates the text of the file in pieces that end after a boundary character of the tokenizer"""
+        if encoding is None:
+            encoding = self.getEncoding()
+        with open(self.fileName,'r',encoding=encoding,errors='replace') as inFile:
+            if self.chunkSize is None:
+                yield inFile.read()
+                return
+            buf = ''
+            while True:
+                chunk = inFile.read(self.chunkSize)
+                if not chunk:
+                    break
+                cut = self.tokenizer.lastBoundary(chunk)
+                if cut:
+                    yield buf + chunk[:cut]
+                    buf = chunk[cut:]
+                else:
+                    buf += chunk
+            if buf:
+                yield buf
     def getWords(self):
-        """Returns iterator on words in text"""
-        self.detector.reset()
-        for line in open(self.fileName, 'rb'):
-            self.detector.feed(line)
-            if self.detector.done: break
-        self.detector.close()
-        inFile = open(self.fileName,'r',encoding=self.detector.result['encoding'],errors='replace')
-#        patt = "[\p{L}][\p{L}\p{Nd}-]*"
-        t = inFile.read()
-#        print(t[1:150])
-        inFile.close()
-        return(re.finditer(tokpatt,t,flags=re.I))
+        """Returns iterator on words (match objects) in text"""
+        for piece in self.getPieces():
+            yield from self.tokenizer.finditer(piece)
+    def getTokens(self):
+        """Returns iterator on lower-cased words in text"""
+        stats = self.stats
+        if stats is None:
+            for piece in self.getPieces():
+                yield from self.tokenizer.tokens(piece)
+            return
+        stats.add('files')
+        stats.add('bytes',os.path.getsize(self.fileName))
+        pieces = self.getPieces(self.getEncoding())
+        while True:
+            t = time.perf_counter()
+            piece = next(pieces,None)
+            stats.addTime('read',time.perf_counter() - t)
+            if piece is None:
+                break
+            t = time.perf_counter()
+            tokens = list(self.tokenizer.tokens(piece))
+            stats.addTime('tokenize',time.perf_counter() - t)
+            yield from tokens
+
+class LDictTokenCache:
+    """On-disk cache of the token frequencies of text files
+    
+    For each file the Counter of its (lower-cased) tokens is kept in a pickle 
+    file in directory, under a key made from the SHA-1 of the contents of the 
+    file, the encoding and the settings of the tokenizer. A changed or renamed 
+    file is therefore recognized, and counting with a new version of a 
+    dictionary only needs a lookup for each word type. The content hashes are 
+    kept by path, size and modification time of the file, in memory and in a 
+    .sha1 file in directory, so that an unchanged file is hashed only once.
+    """
+    def __init__(self, directory):
+        """Creates the cache directory if it does not exist"""
+        self.directory = directory
+        os.makedirs(directory,exist_ok=True)
+    def contentHash(self, fileName):
+        """Returns the SHA-1 of the contents of a file, from memory, from the cache directory or by reading the file"""
+        st = os.stat(fileName)
+        key = (os.path.abspath(fileName),st.st_size,st.st_mtime_ns)
+        if key in contentHashCache:
+            return contentHashCache[key]
+        hashFile = os.path.join(self.directory,hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.sha1')
+        digest = None
+        if os.path.isfile(hashFile):
+            with open(hashFile,encoding='ascii',errors='replace') as f:
+                digest = f.read()
+            if len(digest) != 40:
+                digest = None
+        if digest is None:
+            digest = fileSha1(fileName)
+            tempFile = hashFile + '.' + str(os.getpid())
+            with open(tempFile,'w',encoding='ascii') as f:
+                f.write(digest)
+            os.replace(tempFile,hashFile)
+        contentHashCache[key] = digest
+        return digest
+    def key(self, fileName, encoding=None, tokenizer=None):
+        """Returns the key of the token frequencies of a file"""
+        if tokenizer is None:
+            tokenizer = LDictTokenizer()
+        settings = (tokenCacheFormat,self.contentHash(fileName),encoding,tokenizer.settings())
+        return hashlib.sha1(repr(settings).encode('utf-8')).hexdigest()
+    def getTokenCounts(self, fileName, encoding=None, tokenizer=None, stats=None):
+        """Returns a Counter of the tokens in a file, from the cache or by tokenizing the file (as LDictText)
+        
+        If stats is given, a file read from the cache counts as 'cached'.
+        """
+        cacheFile = os.path.join(self.directory,self.key(fileName,encoding,tokenizer) + '.pickle')
+        if os.path.isfile(cacheFile):
+            try:
+                with open(cacheFile,'rb') as f:
+                    wcount = Counter(pickle.load(f))
+                if stats is not None:
+                    stats.add('cached')
+                return wcount
+            except (pickle.UnpicklingError,EOFError,ValueError,TypeError):
+                pass
+        wcount = Counter(LDictText(fileName,encoding=encoding,tokenizer=tokenizer,stats=stats).getTokens())
+        tempFile = cacheFile + '.' + str(os.getpid())
+        with open(tempFile,'wb') as f:
+            pickle.dump(dict(wcount),f,pickle.HIGHEST_PROTOCOL)
+        os.replace(tempFile,cacheFile)
+        return wcount
+    def clear(self):
+        """Removes all cached token frequencies and content hashes"""
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle') or name.endswith('.sha1'):
+                os.remove(os.path.join(self.directory,name))
+
+def countFileTokens(fileName, encoding=None, tokenizer=None, stats=None, tokenCache=None):
+    """Returns a Counter of the tokens in a file, using tokenCache (an LDictTokenCache) if given"""
+    if tokenCache is not None:
+        return tokenCache.getTokenCounts(fileName,encoding,tokenizer,stats)
+    return Counter(LDictText(fileName,encoding=encoding,tokenizer=tokenizer,stats=stats).getTokens())
+
+class LDictPrefixTrie:
+    """Prefix trie holding the wildcard entries (words ending in '*') of a dictionary
+    
+    Each node is a python dict mapping a character to the next node. A node
+    in which a wildcard entry ends holds the entry under the key None.
+    """
+    def __init__(self):
+        """Creates an empty trie"""
+        self.root = {}
+    def add(self, entry):
+        """Adds a wildcard entry, e.g. 'happi*'"""
+        node = self.root
+        for ch in entry[:-1]:
+            node = node.setdefault(ch,{})
+        node[None] = entry
+    def discard(self, entry):
+        """Removes a wildcard entry and prunes the nodes that are no longer used"""
+        prefix = entry[:-1]
+        path = [self.root]
+        for ch in prefix:
+            if ch not in path[-1]:
+                return
+            path.append(path[-1][ch])
+        path[-1].pop(None,None)
+        for i in range(len(prefix),0,-1):
+            if path[i]:
+                break
+            del path[i-1][prefix[i-1]]
+    def longest(self, word, minLength=2):
+        """Returns the entry with the longest prefix of word (of at least minLength characters), None if there is none"""
+        node = self.root
+        found = node.get(None) if minLength <= 0 else None
+        i = 0
+        for ch in word:
+            node = node.get(ch)
+            if node is None:
+                break
+            i += 1
+            if None in node and i >= minLength:
+                found = node[None]
+        return found
+    def matches(self, word):
+        """Returns all entries whose prefix is a prefix of word, shortest first"""
+        node = self.root
+        found = [node[None]] if None in node else []
+        for ch in word:
+            node = node.get(ch)
+            if node is None:
+                break
+            if None in node:
+                found.append(node[None])
+        return found
+
+class LDictOverlap:
+    """Finds the words that overlap with a wildcard entry in a set of words
+    
+    Used for the 'match' highlighting of LDictMatch.HtmlView. A word without 
+    wildcard overlaps if one of the wildcard entries' prefixes is a prefix of 
+    it; a wildcard entry overlaps if its prefix is a prefix of a word without 
+    wildcard, or if its prefix and the prefix of another wildcard entry are 
+    prefixes of each other. The prefixes are kept in sorted lists, searched 
+    with bisect.
+    """
+    def __init__(self, words):
+        """Indexes a set of words"""
+        self.starWords = {w for w in words if '*' in w}
+        self.noStar = sorted(w for w in words if '*' not in w)
+        self.starPrefixes = sorted(w[:w.find('*')] for w in self.starWords)
+        self.prefixSet = set(self.starPrefixes)
+    def hasPrefix(self, sortedWords, prefix, skip=0):
+        """Returns whether more than skip words in a sorted list start with prefix"""
+        i = bisect_left(sortedWords,prefix) + skip
+        return i < len(sortedWords) and sortedWords[i].startswith(prefix)
+    def match(self, word):
+        """Returns whether word overlaps with a wildcard entry"""
+        pos = word.find('*')
+        if pos == -1:
+            return any(word[:i] in self.prefixSet for i in range(len(word) + 1))
+        prefix = word[:pos]
+        if self.hasPrefix(self.noStar,prefix):
+            return True
+        if any(prefix[:i] in self.prefixSet for i in range(pos)):
+            return True
+        return self.hasPrefix(self.starPrefixes,prefix,1 if word in self.starWords else 0)
+
+class LDictMatcher:
+    """Compiled, read-only form of a dictionary, used for scoring texts
+    
+    Categories are numbered by their position in labels (the distinct category
+    descriptions, ordered by category id). words maps each dictionary entry to a 
+    tuple of category numbers; wildcard entries are found through starTrie. 
+    Create one with LDict.compile().
+    """
+    __slots__ = ('labels','words','starTrie')
+    def __init__(self, catDict):
+        """Compiles an LDictCatDict"""
+        labels = []
+        labelNr = {}
+        catNr = {}
+        for c in sorted(catDict.catDict.keys(),key=lambda a:(int(a))):
+            d = catDict.getDesc(c)
+            if d not in labelNr:
+                labelNr[d] = len(labels)
+                labels.append(d)
+            catNr[c] = labelNr[d]
+        words = {}
+        starTrie = LDictPrefixTrie()
+        for w, cs in catDict.wordIndex.items():
+            words[w] = tuple(sorted({catNr[c] for c in cs}))
+            if w[-1:] == '*':
+                starTrie.add(w)
+        object.__setattr__(self,'labels',tuple(labels))
+        object.__setattr__(self,'words',words)
+        object.__setattr__(self,'starTrie',starTrie)
+    def __setattr__(self, name, value):
+        raise AttributeError('LDictMatcher is read-only')
+    def __getstate__(self):
+        return (self.labels,self.words,self.starTrie)
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__,state):
+            object.__setattr__(self,name,value)
+    def lookup(self, word):
+        """Returns a tuple with the numbers of the categories that would return a hit for the word taking into account the wildcards"""
+        cats = self.words.get(word)
+        if cats is None:
+            entry = self.starTrie.longest(word)
+            if entry is None:
+                return ()
+            cats = self.words[entry]
+        return cats
 
 class LDictCountReport:
-    """Holds categorycounts and word frequencies by category"""
+    """Holds categorycounts and word frequencies by category
+    
+    If stats holds an LDictStats object, the time spent in addWords is added to 
+    it, and the stats of merged reports are added as well.
+    """
     def __init__(self, catList):
         """Creates dictionary holding category counts and dict holding word frequencies"""
+        if not isinstance(catList,(set,frozenset)):
+            catList = list(catList)
         self.catCount = dict.fromkeys(catList,0)
         self.catWordCount = {k:{} for k in catList}
         self.catList = catList
+        self.stats = None
+    def __add__(self, other):
+        """Returns a new report holding the counts of both reports"""
+        cr = LDictCountReport(self.catList)
+        cr.merge(self)
+        cr.merge(other)
+        return cr
+    def addCat(self, cat):
+        """Adds a category without words"""
+        self.catCount[cat] = 0
+        self.catWordCount[cat] = {}
+        if isinstance(self.catList,list):
+            self.catList.append(cat)
+        else:
+            self.catList = self.catList | {cat}
     def addWord(self, word,catList,count=1):
         """increases counters for word in cats"""
         for cat in catList:
@@ -49,6 +567,33 @@ class LDictCountReport:
                 self.catWordCount[cat][word] += count
             else:
                 self.catWordCount[cat][word] = count
+    def addWords(self, words, catLists, counts):
+        """increases counters for many words at once: words[j] in catLists[j], by counts[j]"""
+        if self.stats is not None:
+            t = time.perf_counter()
+        catCount = self.catCount
+        catWordCount = self.catWordCount
+        for w, catList, count in zip(words,catLists,counts):
+            for cat in catList:
+                catCount[cat] += count
+                wc = catWordCount[cat]
+                wc[w] = wc.get(w,0) + count
+        if self.stats is not None:
+            self.stats.addTime('report',time.perf_counter() - t)
+    def merge(self, other):
+        """Adds the counts of another report (e.g. for other files) to this report"""
+        if self.stats is not None and other.stats is not None and other.stats is not self.stats:
+            self.stats.merge(other.stats)
+        for cat in other.catList:
+            if cat not in self.catCount:
+                self.addCat(cat)
+            self.catCount[cat] += other.catCount[cat]
+            wc = self.catWordCount[cat]
+            if not wc:
+                wc.update(other.catWordCount[cat])
+                continue
+            for w, c in other.catWordCount[cat].items():
+                wc[w] = wc.get(w,0) + c
     def write(self,zipout,fq='',freq=0.015):
 #        print(self)
         """Writes frequencies to zipfile"""
@@ -59,24 +604,169 @@ class LDictCountReport:
                 outfile = cat + '.' + fq + '.csv'
             else:
                 outfile = cat + '.csv'
-            txt = kop
-            sumf = sum(self.catWordCount[cat].values()) 
-            for w in sorted(self.catWordCount[cat].keys()):
-                c = self.catWordCount[cat][w]
-#                print(c,sumf,freq,c/sumf > freq)
+            wc = self.catWordCount[cat]
+            sumf = sum(wc.values())
+            lines = [kop]
+            for w in sorted(wc):
+                c = wc[w]
                 if c/sumf > freq:
-                    txt += w
-                    txt += ';' + str(c)
-                    txt += ';' + str(100*c/sumf).replace('.',',')
-                    txt += '\n'
-            zipf.writestr(outfile,txt)
+                    lines.append(w + ';' + str(c) + ';' + str(100*c/sumf).replace('.',',') + '\n')
+            zipf.writestr(outfile,''.join(lines))
         outfile = 'all' + '.' + fq + '.csv'
-        txt = 'word;freq\n'
-        for cat in self.catList:
-            txt += cat + ';' + str(self.catCount[cat])+ '\n'
-        zipf.writestr(outfile,txt)
+        zipf.writestr(outfile,'word;freq\n' + ''.join([cat + ';' + str(self.catCount[cat]) + '\n' for cat in self.catList]))
         zipf.close()
 
+def countWorkerInit(matchers, encoding=None, tokenizer=None, instrument=None, tokenCache=None):
+    """Initializes a worker process of LDict.LDictCount or LDictCountMulti with the compiled dictionaries
+    
+    instrument holds a flag for each dictionary that tells whether stats are collected for it.
+    """
+    global countWorkerMatchers, countWorkerEncoding, countWorkerTokenizer, countWorkerInstrument, countWorkerTokenCache
+    countWorkerMatchers = matchers
+    countWorkerEncoding = encoding
+    countWorkerTokenizer = tokenizer
+    countWorkerInstrument = instrument or [False] * len(matchers)
+    countWorkerTokenCache = tokenCache
+
+def countWorkerFile(fileName):
+    """Returns a list with the LDictCountReport of each dictionary for a single file in a worker process
+    
+    If instrumentation is on for a dictionary, its report holds the LDictStats 
+    of the file (the file counters and timings only for the first dictionary).
+    """
+    reports = []
+    for m, instrument in zip(countWorkerMatchers,countWorkerInstrument):
+        cr = LDictCountReport(set(m.labels))
+        if instrument:
+            cr.stats = LDictStats()
+        reports.append(cr)
+    wcount = countFileTokens(fileName,countWorkerEncoding,countWorkerTokenizer,reports[0].stats,countWorkerTokenCache)
+    for m, cr in zip(countWorkerMatchers,reports):
+        countLookup(m.lookup,m,cr,wcount)
+    return reports
+
+def countLookup(lookup, matcher, cr, wcount):
+    """Adds a Counter of tokens to a count report, using lookup for the category numbers of the tokens"""
+    stats = cr.stats
+    if stats is None:
+        cr.addWords(wcount.keys(),[[matcher.labels[c] for c in lookup(w)] for w in wcount],wcount.values())
+        return
+    t = time.perf_counter()
+    catLists = [[matcher.labels[c] for c in lookup(w)] for w in wcount]
+    stats.addTime('lookup',time.perf_counter() - t)
+    stats.addLookups(matcher,wcount)
+    cr.addWords(wcount.keys(),catLists,wcount.values())
+
+def LDictCountMulti(dictList, fileList, processes=1, encoding=None, tokenizer=None, tokenCache=None):
+    """Creates LIWC count reports for a list of files for several dictionaries in one pass
+    
+    Each file is read and tokenized once, with tokenizer (by default the 
+    tokenizer of the first dictionary), and its tokens are looked up in each of 
+    the dictionaries. Returns a list with an LDictCountReport for each 
+    dictionary, the same as those of LDict.LDictCount. encoding, processes 
+    and tokenCache are as in LDict.LDictCount. If instrumentation is on for 
+    the first dictionary, the file counters and timings are added to its stats.
+    """
+    if tokenizer is None:
+        tokenizer = dictList[0].tokenizer
+    matchers = [LD.compile() for LD in dictList]
+    reports = []
+    for LD, m in zip(dictList,matchers):
+        cr = LDictCountReport(set(m.labels))
+        cr.stats = LD.stats
+        reports.append(cr)
+    if processes != 1:
+        instrument = [LD.stats is not None for LD in dictList]
+        with multiprocessing.Pool(processes,initializer=countWorkerInit,initargs=(matchers,encoding,tokenizer,instrument,tokenCache)) as pool:
+            for parts in pool.imap(countWorkerFile,fileList):
+                for cr, part in zip(reports,parts):
+                    cr.merge(part)
+        return reports
+    for f in fileList:
+        wcount = countFileTokens(f,encoding,tokenizer,dictList[0].stats,tokenCache)
+        for LD, m, cr in zip(dictList,matchers,reports):
+            countLookup(LD.cachedLookup,m,cr,wcount)
+    return reports
+
+def LDictCountStringMulti(dictList, string, tokenizer=None):
+    """Creates LIWC counts for a string for several dictionaries, tokenizing the string once
+    
+    Returns a list with a Counter for each dictionary, the same as those of 
+    LDict.LDictCountString. The string is tokenized with tokenizer (by default 
+    the tokenizer of the first dictionary).
+    """
+    if tokenizer is None:
+        tokenizer = dictList[0].tokenizer
+    wcount = Counter(tokenizer.tokens(string))
+    return [LD.LDictCountTokens(wcount) for LD in dictList]
+
+class LDictCorpusCounts:
+    """Sparse word counts for a corpus of documents, made by LDict.LDictCountWordCorpus
+    
+    docIds, wordIds and counts are NumPy arrays in coordinate (COO) format: 
+    document docIds[k] contains word words[wordIds[k]] counts[k] times. Word 
+    number w belongs to the categories catIndices[catIndptr[w]:catIndptr[w+1]] 
+    (numbers into labels): the word x category incidence matrix in CSR format.
+    """
+    def __init__(self, labels, words, docIds, wordIds, counts, catIndptr, catIndices, ndocs):
+        """Creates the corpus counts object"""
+        self.labels = labels
+        self.words = words
+        self.docIds = docIds
+        self.wordIds = wordIds
+        self.counts = counts
+        self.catIndptr = catIndptr
+        self.catIndices = catIndices
+        self.ndocs = ndocs
+    def incidence(self):
+        """Returns the word x category incidence matrix as a dense NumPy array of 0/1"""
+        import numpy as np
+        m = np.zeros((len(self.words),len(self.labels)),dtype=np.int8)
+        pos, cat = csrExpand(np.arange(len(self.words)),self.catIndptr,self.catIndices)
+        m[pos,cat] = 1
+        return m
+    def docWC(self):
+        """Returns the number of words in each document"""
+        import numpy as np
+        return np.bincount(self.docIds,weights=self.counts,minlength=self.ndocs).astype(self.counts.dtype)
+    def wordTotals(self):
+        """Returns the corpus frequency of each word"""
+        import numpy as np
+        return np.bincount(self.wordIds,weights=self.counts,minlength=len(self.words)).astype(self.counts.dtype)
+    def docCatMatrix(self):
+        """Returns the document x category matrix of category counts (the document x word matrix times the incidence matrix)"""
+        import numpy as np
+        pos, cat = csrExpand(self.wordIds,self.catIndptr,self.catIndices)
+        ncat = len(self.labels)
+        return np.bincount(self.docIds[pos] * ncat + cat,weights=self.counts[pos],minlength=self.ndocs * ncat).astype(self.counts.dtype).reshape(self.ndocs,ncat)
+    def wordCatMatrix(self):
+        """Returns the word x category matrix of corpus frequencies (zero where the word is not in the category)"""
+        return self.incidence() * self.wordTotals()[:,None]
+    def catWords(self, label):
+        """Returns a Counter of the corpus frequencies of the words in a category"""
+        import numpy as np
+        pos, cat = csrExpand(np.arange(len(self.words)),self.catIndptr,self.catIndices)
+        inCat = pos[cat == self.labels.index(label)]
+        return Counter(dict(zip([self.words[w] for w in inCat.tolist()],self.wordTotals()[inCat].tolist())))
+    def docCatWords(self, doc):
+        """Returns the word counts by category of a document, like LDict.LDictCountWordString"""
+        import numpy as np
+        k = np.flatnonzero(self.docIds == doc)
+        liwcCountDict = {}
+        for w, n in zip(self.wordIds[k].tolist(),self.counts[k].tolist()):
+            for c in self.catIndices[self.catIndptr[w]:self.catIndptr[w+1]].tolist():
+                if self.labels[c] not in liwcCountDict:
+                    liwcCountDict[self.labels[c]] = Counter()
+                liwcCountDict[self.labels[c]][self.words[w]] = n
+        return liwcCountDict
+    def scipyMatrices(self):
+        """Returns the document x word and word x category matrices as SciPy CSR matrices (requires SciPy)"""
+        import numpy as np
+        from scipy.sparse import csr_matrix
+        docWord = csr_matrix((self.counts,(self.docIds,self.wordIds)),shape=(self.ndocs,len(self.words)))
+        wordCat = csr_matrix((np.ones(len(self.catIndices),dtype=np.int8),self.catIndices,self.catIndptr),shape=(len(self.words),len(self.labels)))
+        return docWord, wordCat
+
 class LDictUpdateReport:
     """LIWC dictionary update report"""
     def __init__(self, updateFile,dictFile):
@@ -98,6 +788,78 @@ class LDictUpdateReport:
         print('counts',self.counts,'\n')
     def addCat(self,cat):
         self.counts[cat] += 1
+
+class LDictDiffReport:
+    """Differences between two LIWC dictionaries or category lists
+    
+    Created by LDict.LDictDiff (dictLevel True) or LDictCatDict.catDictDiff. 
+    errLines is None if the unhandled lines are the same, else a pair (old, new); 
+    removedWords and addedWords are None if the wordsets are the same. 
+    removedCats and addedCats map category ids to (description, number of words), 
+    changedDescs maps ids to (old, new) descriptions and changedCats maps the ids 
+    of categories with changed words to (old description, new description, 
+    removed words, added words). 
+    """
+    def __init__(self, oldName='', newName='', dictLevel=False):
+        """Creates an empty diff report"""
+        self.oldName = oldName
+        self.newName = newName
+        self.dictLevel = dictLevel
+        self.errLines = None
+        self.removedWords = None
+        self.addedWords = None
+        self.removedCats = {}
+        self.addedCats = {}
+        self.changedDescs = {}
+        self.changedCats = {}
+    def toDict(self):
+        """Returns the differences as a dict of lists, strings and numbers (e.g. for json)"""
+        d = {}
+        if self.dictLevel:
+            d['old'] = self.oldName
+            d['new'] = self.newName
+            d['errLines'] = None if self.errLines is None else {'old':list(self.errLines[0]),'new':list(self.errLines[1])}
+            d['removedWords'] = None if self.removedWords is None else sorted(self.removedWords)
+            d['addedWords'] = None if self.addedWords is None else sorted(self.addedWords)
+        d['removedCats'] = {k:{'desc':desc,'words':n} for k, (desc,n) in self.removedCats.items()}
+        d['addedCats'] = {k:{'desc':desc,'words':n} for k, (desc,n) in self.addedCats.items()}
+        d['changedDescs'] = {k:{'old':old,'new':new} for k, (old,new) in self.changedDescs.items()}
+        d['changedCats'] = {k:{'oldDesc':old,'newDesc':new,'removed':sorted(removed),'added':sorted(added)}
+                            for k, (old,new,removed,added) in self.changedCats.items()}
+        return d
+    def LDictDRPrint(self):
+        """Prints the differences, in the format of LDictCompare and catDictCompare"""
+        if self.dictLevel:
+            print('List differences between dictionaries ',self.oldName,' and ',self.newName)
+            if self.errLines is not None:
+                print('Old unhandled lines: ',self.errLines[0])
+                print('New unhandled lines: ',self.errLines[1])
+            else:
+                print('Same unhandled lines, if any')
+            if self.removedWords is not None:
+                print('Old words not in new dict: ', len(self.removedWords), self.removedWords)
+                print('New words not in old dict: ', len(self.addedWords), self.addedWords)
+            else:
+                print('Same words in dictionaries')
+        if self.removedCats or self.addedCats:
+            print('Old categories not in new dict: (',len(self.removedCats),')')
+            for k, (desc,n) in self.removedCats.items():
+                print (k,desc,n,'words')
+            print('New categories not in old dict: (',len(self.addedCats),')')
+            for k, (desc,n) in self.addedCats.items():
+                print (k,desc,n,'words')
+        else:
+            print('Same categories in use')
+        for k, (old,new) in self.changedDescs.items():
+            print('Category changed description: ',k,old,new)
+        if not self.changedDescs:
+            print('Same categories (if any) have same descriptions')
+        for k, (old,new,removed,added) in self.changedCats.items():
+            print('Category with changed words:',k,old,new)
+            print('Removed words:',len(removed), removed)
+            print('Added words:',len(added), added)
+        if not self.changedCats:
+            print('Same words in corresponding categories (if any)')
     
 class LDictMatch:
     """LIWC dictionary matcher"""
@@ -170,204 +932,247 @@ class LDictMatch:
         print('dictOld',self.dictOld)
         print('dictNew',self.dictNew)
         
-    def HtmlView(self,outFile,LDold,LDnew):
-        html = '<html>\n<head><style type="text/css">\n \
+    def HtmlView(self,outFile,LDold,LDnew,processes=1):
+        """Writes an HTML comparison of an old and a new dictionary, based on the matcher
+        
+        The report is written to outFile category by category. Each category's 
+        section is built independently (htmlViewSection), with processes other 
+        than 1 in a pool of worker processes; the sections are written in order.
+        """
+        hold = LDold.catDict.LDictHierarchies()
+        ehwold = LDold.catDict.LDictExtraHierarchicalWords(hold)
+        hnew = LDnew.catDict.LDictHierarchies()
+        ehwnew = LDnew.catDict.LDictExtraHierarchicalWords(hnew)
+        self.counts = {1:0,2:0,3:0,4:0,5:0}
+        keys = sorted(self.dictNew.keys(),key=lambda a:(int(a)))
+        with open(outFile,'w') as out:
+            html = '<html>\n<head><style type="text/css">\n \
                *{font-family: Arial,Verdana;}\
                td{width:20%;vertical-align:top}\
                table,td{border: 1px solid black;}\
                .noehw{color:grey}\
                .match{background-color:#ffff99}\
                 </style><title>Compare'
-        html += self.fileName
-        html += '</title>\n</head>\n<body>\n<a name="top"/><h1>Compare  LIWC dictionaries</h1>\n<p><b>Matching file:</b> '
-        html += self.fileName
-        html += '<br/>\n<b>Old dict:</b> '
-        html += LDold.fileName
-        html += ',number of words: '
-        html += str(len(LDold.wordSet))
-        html += '<br/><b>New dict:</b> '
-        html += LDnew.fileName
-        html += ',number of words: '
-        html += str(len(LDnew.wordSet))
-        html += '</p>\n<p>Unhandled lines old dict:<br/>'
-        for line in LDold.errLines:
-            html += line
-            html += '<br/>'
-        html += '</p>\n<p>Unhandled lines new dict:<br/>'
-        for line in LDnew.errLines:
-            html += line
-            html += '<br/>'
-        html += '</p>\n<p>(New) categories and category numbers:<br/>'
-        html += LDnew.catDict.htmlLinkList('local')
-        html += '</p>'
-        hold = LDold.catDict.LDictHierarchies()
-        ehwold = LDold.catDict.LDictExtraHierarchicalWords(hold)
-        hnew = LDnew.catDict.LDictHierarchies()
-        ehwnew = LDnew.catDict.LDictExtraHierarchicalWords(hnew)
-        self.counts = {1:0,2:0,3:0,4:0,5:0}
-        trhead = '<tr><td>in old cat; not in new cat<br/>in old dict; not in new dict</td><td>in old cat; not in new cat<br>in old dict; in new dict</td><td>in old cat; in new cat<br/>in old dict; in new dict</td><td>in new cat; not in old cat<br/>in old dict; in new dict</td><td>in new cat; not in old cat<br/>in new dict; not in old dict</td></tr>'
-        for key in sorted(self.dictNew.keys(),key=lambda a:(int(a))):
-            html += '\n<a href="#top">top</a>\n<div id="'
-            html += key
-            html += '">\n<p><b>Category:</b> '
-            html += LDnew.catDict.getDesc(key)
-            html += ' ('
-            html += key
-            html += ')<br/><b>matches old cat:</b> '
-            if self.dictNew[key] == 'none':
-                html += 'none'
-            else:
-                for keyOld in self.dictNew[key]:
-                    html += LDold.catDict.getDesc(keyOld)
-                    html += ' ('
-                    html += keyOld
-                    html += ') '
-            html += '</p>\n<table>' + trhead + '<tr>'
-            oldCatSet = set()
-            self.cel={}
-            if self.dictNew[key] != 'none':
-                for keyOld in self.dictNew[key]:
-                    oldCatSet = oldCatSet | LDold.catDict.getWords(keyOld)
-                self.cel[1] = oldCatSet - LDnew.wordSet
-                self.cel[2] = (oldCatSet & LDnew.wordSet) - LDnew.catDict.getWords(key)
-                self.cel[3] = oldCatSet & LDnew.catDict.getWords(key)
-                self.cel[4] = (LDnew.catDict.getWords(key) & LDold.wordSet) - oldCatSet
+            html += self.fileName
+            html += '</title>\n</head>\n<body>\n<a name="top"/><h1>Compare  LIWC dictionaries</h1>\n<p><b>Matching file:</b> '
+            html += self.fileName
+            html += '<br/>\n<b>Old dict:</b> '
+            html += LDold.fileName
+            html += ',number of words: '
+            html += str(len(LDold.wordSet))
+            html += '<br/><b>New dict:</b> '
+            html += LDnew.fileName
+            html += ',number of words: '
+            html += str(len(LDnew.wordSet))
+            html += '</p>\n<p>Unhandled lines old dict:<br/>'
+            html += ''.join([line + '<br/>' for line in LDold.errLines])
+            html += '</p>\n<p>Unhandled lines new dict:<br/>'
+            html += ''.join([line + '<br/>' for line in LDnew.errLines])
+            html += '</p>\n<p>(New) categories and category numbers:<br/>'
+            html += LDnew.catDict.htmlLinkList('local')
+            html += '</p>'
+            out.write(html)
+            if processes != 1:
+                with multiprocessing.Pool(processes,initializer=viewWorkerInit,initargs=(self,LDold,LDnew,ehwold,ehwnew)) as pool:
+                    sections = pool.imap(viewWorkerSection,keys)
+                    self.writeSections(out,sections)
             else:
-                self.cel[1] = set()
-                self.cel[2] = set()
-                self.cel[3] = set()
-                self.cel[4] = LDnew.catDict.getWords(key) & LDold.wordSet
-            self.cel[5] = LDnew.catDict.getWords(key) - LDold.wordSet
-            setstar = set()
-            setnostar = set()
-            for w in LDnew.catDict.getWords(key) | oldCatSet:
-                if w.count('*') > 0:
-                    setstar.add(w)
-                else:
-                    setnostar.add(w)
-            ehwtemp = set()
+                self.writeSections(out,(self.htmlViewSection(key,LDold,LDnew,ehwold,ehwnew) for key in keys))
+            html = '\n<div><p><b>Totals</b><table>' + htmlViewHead + '<tr>'
+            for c in sorted(self.counts):
+                html += '<td>' + str(self.counts[c]) + '</td>'
+            html += '</table></div>'
+            html += '</body></html>'
+            out.write(html)
+    def writeSections(self, out, sections):
+        """Writes the sections of HtmlView and adds their cell counts to the totals"""
+        for html, cellcounts in sections:
+            out.write(html)
+            for c in cellcounts:
+                self.counts[c] += cellcounts[c]
+    def htmlViewSection(self,key,LDold,LDnew,ehwold,ehwnew):
+        """Returns the HtmlView section for new category key and the number of words in each of its cells"""
+        html = []
+        html.append('\n<a href="#top">top</a>\n<div id="')
+        html.append(key)
+        html.append('">\n<p><b>Category:</b> ')
+        html.append(LDnew.catDict.getDesc(key))
+        html.append(' (')
+        html.append(key)
+        html.append(')<br/><b>matches old cat:</b> ')
+        if self.dictNew[key] == 'none':
+            html.append('none')
+        else:
             for keyOld in self.dictNew[key]:
-                if keyOld in ehwold:
-                    ehwtemp = ehwtemp | ehwold[keyOld]
-            for c in self.cel:
-                html += '\n<td>'
-                firstletter = ''
-                for w in sorted(self.cel[c]):
-                    if firstletter != w[0]:
-                        html += '<span style="color:red;font-weight:bold">' + w[0] + ' </span>'
-                    firstletter = w[0]
-                    classstr = ''
-                    if c < 3:
-                        if (len(ehwtemp) > 0) & (w not in ehwtemp):
+                html.append(LDold.catDict.getDesc(keyOld))
+                html.append(' (')
+                html.append(keyOld)
+                html.append(') ')
+        html.append('</p>\n<table>' + htmlViewHead + '<tr>')
+        oldCatSet = set()
+        cel={}
+        if self.dictNew[key] != 'none':
+            for keyOld in self.dictNew[key]:
+                oldCatSet = oldCatSet | LDold.catDict.getWords(keyOld)
+            cel[1] = oldCatSet - LDnew.wordSet
+            cel[2] = (oldCatSet & LDnew.wordSet) - LDnew.catDict.getWords(key)
+            cel[3] = oldCatSet & LDnew.catDict.getWords(key)
+            cel[4] = (LDnew.catDict.getWords(key) & LDold.wordSet) - oldCatSet
+        else:
+            cel[1] = set()
+            cel[2] = set()
+            cel[3] = set()
+            cel[4] = LDnew.catDict.getWords(key) & LDold.wordSet
+        cel[5] = LDnew.catDict.getWords(key) - LDold.wordSet
+        overlap = LDictOverlap(LDnew.catDict.getWords(key) | oldCatSet)
+        ehwtemp = set()
+        for keyOld in self.dictNew[key]:
+            if keyOld in ehwold:
+                ehwtemp = ehwtemp | ehwold[keyOld]
+        for c in cel:
+            html.append('\n<td>')
+            firstletter = ''
+            for w in sorted(cel[c]):
+                if firstletter != w[0]:
+                    html.append('<span style="color:red;font-weight:bold">' + w[0] + ' </span>')
+                firstletter = w[0]
+                classstr = ''
+                if c < 3:
+                    if (len(ehwtemp) > 0) & (w not in ehwtemp):
+                        classstr = 'noehw '
+                else:
+                    if key in ehwnew:
+                        if w not in ehwnew[key]:
                             classstr = 'noehw '
-                    else:
-                        if key in ehwnew:
-                            if w not in ehwnew[key]:
-                                classstr = 'noehw '
-                    match = False
-                    if w.count('*') > 0:
-                        pos = w.find('*')
-                        for w1 in setnostar:
-                            if w[:pos] == w1[:pos]:
-                                match = True
-                                break
-                        if match == False:
-                            for w1 in setstar:
-                                if w != w1:
-                                    pos1 = w1.find('*')
-                                    pos2 = min(pos1,pos)
-                                    if w[:pos2] == w1[:pos2]:
-                                        match = True
-                                        break
-                    else:
-                        for w1 in setstar:
-                            pos = w1.find('*')
-                            if w[:pos] == w1[:pos]:
-                                match = True
-                                break
-                    if match == True:
-                        classstr += 'match'
-                    if classstr == '':
-                        html += w
-                    else:
-                        html += '<span class="'+classstr+'">'+w+'</span>'
-                    html += ' '
-                html += '</td>'
-            html += '</tr><tr>'
-            for c in self.cel:
-                html += '\n<td>'
-                cellcount = len(self.cel[c])
-                html += str(cellcount)
-                self.counts[c] += cellcount
-                html += '</td>'
-            html += '</tr></table></div>'
-        html += '\n<div><p><b>Totals</b><table>' + trhead + '<tr>'
-        for c in sorted(self.counts):
-            html += '<td>' + str(self.counts[c]) + '</td>'
-        html += '</table></div>'
-        html += '</body></html>'
-        outFile= open(outFile,'w')
-        outFile.write(html)
-        outFile.close()
+                if overlap.match(w):
+                    classstr += 'match'
+                if classstr == '':
+                    html.append(w)
+                else:
+                    html.append('<span class="'+classstr+'">'+w+'</span>')
+                html.append(' ')
+            html.append('</td>')
+        html.append('</tr><tr>')
+        cellcounts = {}
+        for c in cel:
+            html.append('\n<td>')
+            cellcounts[c] = len(cel[c])
+            html.append(str(cellcounts[c]))
+            html.append('</td>')
+        html.append('</tr></table></div>')
+        return ''.join(html), cellcounts
+
+htmlViewHead = '<tr><td>in old cat; not in new cat<br/>in old dict; not in new dict</td><td>in old cat; not in new cat<br>in old dict; in new dict</td><td>in old cat; in new cat<br/>in old dict; in new dict</td><td>in new cat; not in old cat<br/>in old dict; in new dict</td><td>in new cat; not in old cat<br/>in new dict; not in old dict</td></tr>'
+
+def viewWorkerInit(matcher, LDold, LDnew, ehwold, ehwnew):
+    """Initializes a worker process of LDictMatch.HtmlView"""
+    global viewWorkerArgs
+    viewWorkerArgs = (matcher,LDold,LDnew,ehwold,ehwnew)
+
+def viewWorkerSection(key):
+    """Returns an HtmlView section in a worker process of LDictMatch.HtmlView"""
+    matcher, LDold, LDnew, ehwold, ehwnew = viewWorkerArgs
+    return matcher.htmlViewSection(key,LDold,LDnew,ehwold,ehwnew)
 
 class LDict:
     """LIWC dictionary"""
-    def __init__(self, fileName,encoding='utf-8'):
-        """Reads a dictionary file if onse is provided, sets up the category dictionary object and the wordSet"""
+    def __init__(self, fileName,encoding='utf-8',cacheSize=100000,tokenizer=None,cacheFile=None):
+        """Reads a dictionary file if onse is provided, sets up the category dictionary object and the wordSet
+        
+        cacheSize is the maximum number of tokens whose categories are kept in the 
+        (least recently used) lookup cache of the counting functions. tokenizer 
+        is the LDictTokenizer used by the counting functions (by default an 
+        LDictFastTokenizer). If a cacheFile is given, the parsed dictionary is 
+        loaded from it, unless the dictionary file has changed since the cache 
+        file was written; in that case the cache file is rewritten.
+        
+        Progress is reported through the 'LIWCtools' logger (at level INFO; a 
+        file that is not a dictionary file is a WARNING).
+        """
         self.fileName = fileName
         self.errLines = []
         self.wordSet = set()
         self.catDict = LDictCatDict({})
-        print('Reading dictionary file', fileName)
+        self.matcher = None
+        self.matcherKey = None
+        self.cacheSize = cacheSize
+        self.cachedLookup = None
+        if tokenizer is None:
+            tokenizer = LDictFastTokenizer()
+        self.tokenizer = tokenizer
+        self.stats = None
+        self.batchLevel = 0
+        logger.info('Reading dictionary file %s',fileName)
         if fileName == '':
             return
+        t = time.perf_counter()
+        if cacheFile is not None and self.LDictLoad(cacheFile,encoding):
+            logger.info('loaded from cache file %s in %.3f s',cacheFile,time.perf_counter() - t)
+            return
         dictFile= open(fileName,'r',encoding=encoding)
-        print('encoding =', encoding)
+        logger.info('encoding = %s',encoding)
         dictLine = dictFile.readline()[:-1]
         if dictLine != '%':
-            print('Not a dictfile: ',dictLine)
+            logger.warning('Not a dictfile: %s',dictLine)
         dictLine = dictFile.readline()[:-1]
         while dictLine != '%':
             ls = dictLine.strip().split()
             if ls[0].isdecimal():
                 self.catDict.addCat(ls[0],ls[1],set())
             dictLine = dictFile.readline()[:-1]
-        dictLine = dictFile.readline()[:-1]
-        emptylines = 0
-        while (dictLine != '%'):
-            if emptylines > 10:
-                break
-            if dictLine == '':
-                emptylines += 1
-            elif dictLine.find('(') + dictLine.find('<') > -2:
-                emptylines = 0
-                self.errLines.append(dictLine)
-            else:
-                emptylines = 0
-                ls = dictLine.split('\t')
-#                print(dictLine)
-                self.wordSet.add(ls[0])
-                for j in ls[1:]:
-                    if j != '':
-                        self.catDict.addWord(j,ls[0])
+        with gcPaused():
             dictLine = dictFile.readline()[:-1]
-        dictFile.close()        
-        print('number of words :',len(self.wordSet))
-        print('number of categories :',len(self.catDict.catDict.keys()))
+            emptylines = 0
+            wordSet = self.wordSet
+            catWords = {}
+            index = {}
+            while (dictLine != '%'):
+                if emptylines > 10:
+                    break
+                if dictLine == '':
+                    emptylines += 1
+                elif dictLine.find('(') + dictLine.find('<') > -2:
+                    emptylines = 0
+                    self.errLines.append(dictLine)
+                else:
+                    emptylines = 0
+                    ls = dictLine.split('\t')
+#                    print(dictLine)
+                    w = ls[0]
+                    wordSet.add(w)
+                    cs = set()
+                    for j in ls[1:]:
+                        if j != '':
+                            if j not in catWords:
+                                catWords[j] = (str(int(j)),self.catDict.getWords(j))
+                            c, ws = catWords[j]
+                            ws.add(w)
+                            cs.add(c)
+                    if cs:
+                        if w in index:
+                            index[w] |= cs
+                        else:
+                            index[w] = cs
+                dictLine = dictFile.readline()[:-1]
+            dictFile.close()        
+            self.catDict.setWordIndex(index)
+        logger.info('number of words : %d',len(self.wordSet))
+        logger.info('number of categories : %d',len(self.catDict.catDict.keys()))
+        logger.info('read in %.3f s',time.perf_counter() - t)
+        if cacheFile is not None:
+            self.LDictSave(cacheFile,encoding)
     def LDictCompare(self,LDnew):
-        """Compares two dictionaries"""
-        print('List differences between dictionaries ',self.LDictFileName(),' and ',LDnew.LDictFileName())
+        """Compares two dictionaries and prints the differences"""
+        self.LDictDiff(LDnew).LDictDRPrint()
+    def LDictDiff(self,LDnew):
+        """Returns an LDictDiffReport holding the differences between two dictionaries"""
+        report = LDictDiffReport(self.LDictFileName(),LDnew.LDictFileName(),True)
         if self.errLines != LDnew.errLines:
-            print('Old unhandled lines: ',self.errLines)
-            print('New unhandled lines: ',LDnew.errLines)
-        else:
-            print('Same unhandled lines, if any')
-        if self.wordSet != LDnew.wordSet:
-            print('Old words not in new dict: ', len(self.wordSet - LDnew.wordSet), self.wordSet - LDnew.wordSet)
-            print('New words not in old dict: ', len(LDnew.wordSet - self.wordSet), LDnew.wordSet - self.wordSet)
-        else:
-            print('Same words in dictionaries')
-        self.catDict.catDictCompare(LDnew.catDict)
+            report.errLines = (self.errLines,LDnew.errLines)
+        if self.wordSet is not LDnew.wordSet and self.wordSet != LDnew.wordSet:
+            report.removedWords = self.wordSet - LDnew.wordSet
+            report.addedWords = LDnew.wordSet - self.wordSet
+        return self.catDict.catDictDiff(LDnew.catDict,report)
     def LDictComplete(self,LDmodel):
         """Complete a dictionary with hierarchic relationships 
         
@@ -380,38 +1185,207 @@ class LDict:
         for h in LDmodel.catDict.LDictHierarchies():
             print(h)
             self.catDict.addWordSet(h[1],self.catDict.getWords(h[0]))
-    def LDictCount(self,fileList):
-        """Creates a LIWC count report for a list of files"""
-        cs = {self.catDict.getDesc(c) for c in self.catDict.getDictCatSet()}
-        cr = LDictCountReport(cs)
-        for f in fileList:
-            t = LDictText(f)
-            for w in t.getWords():
-                cs = {self.catDict.getDesc(c) for c in self.catDict.getCatSetStarred(w.group(0).lower())}
-                cr.addWord(w.group(0).lower(),cs)
-        return cr
+    def compile(self):
+        """Returns an LDictMatcher for the dictionary
+        
+        The matcher is kept and only rebuilt after the categories have changed.
+        Rebuilding the matcher also starts a new lookup cache (cachedLookup).
+        """
+        if self.matcherKey is None or self.matcherKey[0] is not self.catDict or self.matcherKey[1] != self.catDict.version:
+            self.matcher = LDictMatcher(self.catDict)
+            self.matcherKey = (self.catDict,self.catDict.version)
+            self.cachedLookup = lru_cache(maxsize=self.cacheSize)(self.matcher.lookup)
+        return self.matcher
+    def LDictInstrument(self, enable=True):
+        """Switches collection of counters and timings by the counting functions on or off
+        
+        With enable=True a new LDictStats object is started (and returned); 
+        LDictCount, LDictCountString and LDictCountWordString add to it until 
+        instrumentation is switched off. The collected stats are in self.stats 
+        (None when instrumentation is off); self.stats.asDict() returns them as 
+        a dict.
+        """
+        self.stats = LDictStats() if enable else None
+        return self.stats
+    @contextlib.contextmanager
+    def batch(self):
+        """Context in which a series of edits recomputes derived state only once
+        
+        Inside a batch, LDictRestoreWS only marks wordSet as out of date; it is 
+        re-created from the categories when it is next read, so many edits 
+        followed by one read cost one re-creation. The hierarchies and the 
+        compiled matcher are cached until the categories change, and rebuilt 
+        when next needed. Batches can be nested:
+        
+            with LD.batch():
+                for f in changeFiles:
+                    LD.LDictUpdate(f,LDmodel)
+        """
+        self.batchLevel += 1
+        try:
+            yield self
+        finally:
+            self.batchLevel -= 1
+    @property
+    def wordSet(self):
+        """Set of the words in the dictionary, re-created from the categories if it was marked out of date in a batch"""
+        if self.wordSetStale:
+            self.storedWordSet = self.catDict.getAllWords()
+            self.wordSetStale = False
+        return self.storedWordSet
+    @wordSet.setter
+    def wordSet(self, wordSet):
+        self.storedWordSet = wordSet
+        self.wordSetStale = False
+    def LDictCacheInfo(self):
+        """Returns hits, misses, maxsize and currsize of the lookup cache of the counting functions"""
+        self.compile()
+        return self.cachedLookup.cache_info()
+    def LDictClearCache(self):
+        """Empties the lookup cache of the counting functions"""
+        self.matcher = None
+        self.matcherKey = None
+        self.cachedLookup = None
+    def __getstate__(self):
+        """Leaves the compiled matcher and its cache out of copies and pickles"""
+        state = self.__dict__.copy()
+        state['matcher'] = None
+        state['matcherKey'] = None
+        state['cachedLookup'] = None
+        return state
     def LDictCountString(self,string):
         """Creates LIWC counts for a string"""
-        i = re.finditer(tokpatt,string,flags=re.I)
+        stats = self.stats
+        if stats is not None:
+            t = time.perf_counter()
+        wcount = Counter(self.tokenizer.tokens(string))
+        if stats is not None:
+            stats.addTime('tokenize',time.perf_counter() - t)
+        return self.LDictCountTokens(wcount)
+    def LDictCountTokens(self,wcount):
+        """Creates LIWC counts (as LDictCountString) from a Counter of (lower-cased) tokens"""
+        m = self.compile()
+        lookup = self.cachedLookup
+        stats = self.stats
+        if stats is not None:
+            t = time.perf_counter()
+        counts = [0] * len(m.labels)
+        for w, n in wcount.items():
+            for c in lookup(w):
+                counts[c] += n
+        if stats is not None:
+            stats.addTime('lookup',time.perf_counter() - t)
+            stats.addLookups(m,wcount)
         cnt = Counter()
-        for w in i:
-            cnt['WC'] +=1
-            for c in {self.catDict.getDesc(c) for c in self.catDict.getCatSetStarred(w.group(0).lower())}:
-                cnt[c] +=1
+        if wcount:
+            cnt['WC'] = sum(wcount.values())
+        for c, n in enumerate(counts):
+            if n:
+                cnt[m.labels[c]] = n
         return cnt
+    def LDictCountBatch(self,strings,percentages=False,batchSize=10000):
+        """Creates LIWC counts for an iterable of strings
+        
+        Returns a list of column names (the category descriptions followed by 'WC') 
+        and a NumPy integer array holding a row of counts for each string. With 
+        percentages=True the category columns hold percentages of WC, as in LIWC 
+        output. Tokens are collected as word ids in flat arrays and turned into 
+        counts for batchSize strings at a time. Requires NumPy.
+        """
+        import numpy as np
+        m = self.compile()
+        lookup = self.cachedLookup
+        ncol = len(m.labels) + 1
+        vocab = {}
+        indptr = array('l',[0])
+        indices = array('l')
+        blocks = []
+        tokIds = array('l')
+        docEnds = array('l')
+        def flush():
+            tok = np.frombuffer(tokIds,dtype=tokIds.typecode)
+            ends = np.frombuffer(docEnds,dtype=docEnds.typecode)
+            ndoc = len(ends)
+            wc = np.diff(ends,prepend=0)
+            pos, cat = csrExpand(tok,np.frombuffer(indptr,dtype=indptr.typecode),np.frombuffer(indices,dtype=indices.typecode))
+            doc = np.repeat(np.arange(ndoc),wc)[pos]
+            block = np.bincount(doc * ncol + cat,minlength=ndoc * ncol).reshape(ndoc,ncol)
+            block[:,-1] = wc
+            blocks.append(block)
+        for string in strings:
+            for w in self.tokenizer.tokens(string):
+                i = vocab.get(w)
+                if i is None:
+                    i = vocab[w] = len(vocab)
+                    indices.extend(lookup(w))
+                    indptr.append(len(indices))
+                tokIds.append(i)
+            docEnds.append(len(tokIds))
+            if len(docEnds) == batchSize:
+                flush()
+                tokIds = array('l')
+                docEnds = array('l')
+        if docEnds or not blocks:
+            flush()
+        counts = np.vstack(blocks)
+        if percentages:
+            wc = counts[:,-1:]
+            counts = np.hstack([np.divide(100.0 * counts[:,:-1],wc,out=np.zeros((len(counts),ncol - 1)),where=wc > 0),wc])
+        return list(m.labels) + ['WC'], counts
+    def LDictCountWordCorpus(self,strings):
+        """Creates sparse LIWC word counts for an iterable of strings
+        
+        Returns an LDictCorpusCounts object holding the (document, word, count) 
+        triples and the word x category incidence of all words in the corpus as 
+        NumPy arrays, from which category x document or word x category totals 
+        can be computed. Requires NumPy.
+        """
+        import numpy as np
+        m = self.compile()
+        lookup = self.cachedLookup
+        vocab = {}
+        words = []
+        indptr = array('l',[0])
+        indices = array('l')
+        docIds = array('l')
+        wordIds = array('l')
+        counts = array('l')
+        ndocs = 0
+        for string in strings:
+            for w, n in Counter(self.tokenizer.tokens(string)).items():
+                i = vocab.get(w)
+                if i is None:
+                    i = vocab[w] = len(words)
+                    words.append(w)
+                    indices.extend(lookup(w))
+                    indptr.append(len(indices))
+                docIds.append(ndocs)
+                wordIds.append(i)
+                counts.append(n)
+            ndocs += 1
+        arrays = [np.frombuffer(a,dtype=a.typecode) if len(a) else np.zeros(0,dtype=a.typecode) for a in (docIds,wordIds,counts,indptr,indices)]
+        return LDictCorpusCounts(m.labels,words,arrays[0],arrays[1],arrays[2],arrays[3],arrays[4],ndocs)
     def LDictCountWordString(self,string):
         """Creates LIWC word counts for a string"""
-        i = re.finditer(tokpatt,string,flags=re.I)
-        liwcCountDict = {}
-        wcount = Counter()
-        for w in i:
-            wcount[w.group(0).lower()] += 1
+        m = self.compile()
+        lookup = self.cachedLookup
+        stats = self.stats
+        if stats is not None:
+            t = time.perf_counter()
+        wcount = Counter(self.tokenizer.tokens(string))
+        if stats is not None:
+            stats.addTime('tokenize',time.perf_counter() - t)
+            t = time.perf_counter()
+        catWords = {}
         for w in wcount:
-            for c in {self.catDict.getDesc(c) for c in self.catDict.getCatSetStarred(w)}:
-                if c not in liwcCountDict:
-                    liwcCountDict[c] = Counter()
-                liwcCountDict[c][w] += wcount[w]
-        return liwcCountDict
+            for c in lookup(w):
+                if c not in catWords:
+                    catWords[c] = Counter()
+                catWords[c][w] = wcount[w]
+        if stats is not None:
+            stats.addTime('lookup',time.perf_counter() - t)
+            stats.addLookups(m,wcount)
+        return {m.labels[c]:catWords[c] for c in catWords}
     def LDictDDupAdd(self,inFile):
         """Finish deduplication of dictionary 
         
@@ -491,31 +1465,74 @@ class LDict:
         """Removes all words from a category"""
         self.catDict.emptyCat(cat,LDmodel)
     def LDictExpand(self,wl):
-        """Expands wildcard in dictionary based on wordlist"""
-        for term in self.catDict.getAllWords():
-            if '*' in term:
-                cats = self.catDict.getCatSet(term)
-                for cat in cats:
-                    self.catDict.dropWord(cat,term)
-                for word in [word for word in wl if word.startswith(term[:-1])]:
-                    for cat in cats:
-                        self.catDict.addWord(cat, word)
+        """Expands wildcard in dictionary based on wordlist
+        
+        wl is any iterable of words, or the name of a (utf-8) file holding a word 
+        per line. It is read once; each word is matched against a trie of the 
+        wildcard terms. The dictionary is updated at the end, per category.
+        """
+        terms = [term for term in self.catDict.getAllWords() if '*' in term]
+        if isinstance(wl,str):
+            with open(wl,'r',encoding='utf-8') as f:
+                expansions = self.LDictExpansions(terms,(line.strip() for line in f if line.strip() != ''))
+        else:
+            expansions = self.LDictExpansions(terms,wl)
+        catAdds = {}
+        catDrops = {}
+        for term in terms:
+            for cat in self.catDict.getCatSet(term):
+                catDrops.setdefault(cat,set()).add(term)
+                catAdds.setdefault(cat,set()).update(expansions[term])
+        for cat in catDrops:
+            self.catDict.dropWordSet(cat,catDrops[cat])
+            self.catDict.addWordSet(cat,catAdds[cat])
         self.LDictRestoreWS()
+    def LDictExpansions(self,terms,words):
+        """Returns a dict that maps each wildcard term to the set of words that start with the term (without its last character)"""
+        trie = LDictPrefixTrie()
+        expansions = {}
+        for term in terms:
+            trie.add(term)
+            expansions[term] = set()
+        for word in words:
+            for term in trie.matches(word):
+                expansions[term].add(word)
+        return expansions
     def LDictFileName(self):
         """Returns the filename belonging to a dictionary, -none- if it is a newly created dictionary"""
         if self.fileName != '':
             return self.fileName
         else:
             return '-none-'
-    def LDictCount(self,fileList):
-        """Creates a LIWC count report for a list of files"""
-        cs = {self.catDict.getDesc(c) for c in self.catDict.getDictCatSet()}
-        cr = LDictCountReport(cs)
+    def LDictCount(self,fileList,processes=1,encoding=None,tokenCache=None):
+        """Creates a LIWC count report for a list of files
+        
+        The encoding of the files is detected, unless an encoding is given.
+        
+        With processes > 1 (or None, for one process per cpu) the files are 
+        divided over a pool of worker processes, each of which receives the 
+        compiled dictionary once. The reports of the files are merged in the 
+        order of fileList, so the result is the same as that of a serial count.
+        
+        With an LDictTokenCache as tokenCache, the token frequencies of files 
+        that were counted before are taken from the cache.
+        
+        If instrumentation is on (see LDictInstrument), the counters and timings 
+        of all files are added to self.stats, which is also the stats of the 
+        report.
+        """
+        m = self.compile()
+        lookup = self.cachedLookup
+        cr = LDictCountReport(set(m.labels))
+        cr.stats = self.stats
+        if processes != 1:
+            with multiprocessing.Pool(processes,initializer=countWorkerInit,initargs=([m],encoding,self.tokenizer,[self.stats is not None],tokenCache)) as pool:
+                for parts in pool.imap(countWorkerFile,fileList):
+                    cr.merge(parts[0])
+            return cr
         for f in fileList:
-            t = LDictText(f)
-            for w in t.getWords():
-                cs = {self.catDict.getDesc(c) for c in self.catDict.getCatSetStarred(w.group(0).lower())}
-                cr.addWord(w.group(0).lower(),cs)
+            wcount = countFileTokens(f,encoding,self.tokenizer,self.stats,tokenCache)
+            countLookup(lookup,m,cr,wcount)
         return cr
     def LDictEdit(self,updfile,encoding='utf-8'):
         f = open(updfile,'r',encoding=encoding)
@@ -538,69 +1555,60 @@ class LDict:
     def LDictFreq(self,freqlist,zipout):
         """Based on a word frequency list as produced by Stylo, creates a zipfile 
         that holds csv fils holding the most frequent words in each category, once 
-        with absolute and once with relative frequencies"""
-        csvfile = open(freqlist,'r',newline='',encoding='iso-8859-1')
-        reader = csv.reader(csvfile,delimiter='\t')
+        with absolute and once with relative frequencies
+        
+        The table is read into a NumPy matrix (words x texts); the sums, relative
+        frequencies and the 'rest' row (words below .02 in all texts) are computed
+        per category on the rows of its words. Requires NumPy.
+        """
+        import numpy as np
+        m = self.compile()
+        lookup = self.cachedLookup
+        with open(freqlist,'r',newline='',encoding='iso-8859-1') as csvfile:
+            reader = csv.reader(csvfile,delimiter='\t')
+            files = next(reader)
+            words = []
+            rows = []
+            for row in reader:
+                words.append(row[0])
+                rows.append(row[1:])
+        freqs = np.array(rows,dtype=float).reshape(len(rows),len(files))
+        wordRow = {}
+        for i, w in enumerate(words):
+            wordRow[w] = i
+        catRows = [[] for d in m.labels]
+        for w in wordRow:
+            for c in lookup(w):
+                catRows[c].append(wordRow[w])
         results = {}
         relresults = {}
-        for c in self.catDict.getDictCatSet():
-            d = self.catDict.getDesc(c)
+        for c, d in enumerate(m.labels):
             results[d] = {}
             relresults[d] = {}
-        firstrow = True
-        for row in reader:
-            if firstrow:
-                firstrow = False
-                files = row
+            if not catRows[c]:
                 continue
-            w = row[0]
-            row = row[1:]
-            for c in self.catDict.getCatSetStarred(w):
-                d = self.catDict.getDesc(c)
-                j = 0
-                results[d][w] = {}
-                for n in row:
-                    results[d][w][files[j]] = float(n)
-                    j = j + 1
-        for d in results.keys():
-            sums = dict.fromkeys(files,0)
-            for w in results[d].keys():
-                for f in results[d][w].keys():
-                    sums[f] += results[d][w][f]
-            rest = dict.fromkeys(files,0)
-            for w in list(results[d].keys()):
-                q = {k:(v/sums[k] if sums[k] > 0 else 0) for k,v in results[d][w].items()}
-                if max(q.values()) < .02:
-                    for k,v in results[d][w].items():
-                        rest[k] += v
-                    del results[d][w]
-                else: 
-                    relresults[d][w] = q
-            if max(rest.values()) > 0:
-                results[d]['rest'] = rest
+            rowWords = [words[i] for i in catRows[c]]
+            v = freqs[catRows[c]]
+            sums = columnSums(v)
+            q = np.divide(v,sums,out=np.zeros_like(v),where=sums > 0)
+            keep = q.max(axis=1) >= .02
+            relStrings = freqStrings(q[keep],(sums > 0).tolist())
+            for w, vs, qs in zip([w for w, k in zip(rowWords,keep) if k],freqStrings(v[keep]),relStrings):
+                results[d][w] = vs
+                relresults[d][w] = qs
+            if not keep.all():
+                rest = columnSums(v[~keep])
+                if rest.max() > 0:
+                    results[d]['rest'] = freqStrings(rest[np.newaxis])[0]
         zipf = ZipFile(zipout,'w')
         kop = 'word'+';'+';'.join(files)+'\n'
         for d in results.keys():
-            outfile = d + '.csv'
-            txt = kop
-            for w in sorted(results[d].keys()):
-                txt += w
-                for f in files:
-                    txt += ';' + str(results[d][w][f]).replace('.',',')
-                txt += '\n'
-            zipf.writestr(outfile,txt)
+            zipf.writestr(d + '.csv',kop + ''.join([w + ';' + ';'.join(results[d][w]) + '\n' for w in sorted(results[d].keys())]))
         for d in relresults.keys():
-            outfile = d + 'rel.csv'
-            txt = kop
-            for w in sorted(relresults[d].keys()):
-                txt += w
-                for f in files:
-                    txt += ';' + str(relresults[d][w][f]).replace('.',',')
-                txt += '\n'
-            zipf.writestr(outfile,txt)
+            zipf.writestr(d + 'rel.csv',kop + ''.join([w + ';' + ';'.join(relresults[d][w]) + '\n' for w in sorted(relresults[d].keys())]))
         zipf.close()
     def LDictHtml(self,outFileName,encoding='utf-8'):
-        """Creates HTML representation of dictionary"""
+        """Creates HTML representation of dictionary, written category by category"""
         html = '<html>\n<head><style type="text/css">\n *{font-family: Arial,Verdana;}\
         .noehw{color:grey}</style><title>'
         html += self.fileName
@@ -611,23 +1619,103 @@ class LDict:
         html += '</p><p>Total number of words: '
         html += str(len(self.wordSet))
         html += '</p><p>Unhandled lines:<br/>'
-        for line in self.errLines:
-            html += line
-            html += '<br/>'
+        html += ''.join([line + '<br/>' for line in self.errLines])
         html += '</p>'
-        html += self.catDict.htmlDivList()
-        html += '</body></html>'
-        outFile= open(outFileName,'w',encoding=encoding)
-        outFile.write(html)
-        outFile.close()
+        with open(outFileName,'w',encoding=encoding) as outFile:
+            outFile.write(html)
+            outFile.writelines(self.catDict.htmlDivChunks())
+            outFile.write('</body></html>')
+    def LDictLoad(self, cacheFile, encoding='utf-8'):
+        """Loads the parsed dictionary from a cache file written by LDictSave
+        
+        Returns False (and loads nothing) if the cache file does not exist, was 
+        written for another dictionary file or encoding, or if the dictionary 
+        file has changed since. A changed modification time alone does not make 
+        the cache stale if the contents of the dictionary file are unchanged; the 
+        header of the cache file is then updated with the new modification time. 
+        A damaged cache file is treated as stale.
+        """
+        if not os.path.isfile(cacheFile):
+            return False
+        with open(cacheFile,'rb') as f:
+            try:
+                header = pickle.load(f)
+            except (pickle.UnpicklingError,EOFError,ValueError,AttributeError,ImportError,IndexError,TypeError):
+                return False
+            if not isinstance(header,dict) or header.get('format') != dictCacheFormat:
+                return False
+            if header['fileName'] != os.path.abspath(self.fileName) or header['encoding'] != encoding:
+                return False
+            st = os.stat(self.fileName)
+            touched = (header['size'],header['mtime']) != (st.st_size,st.st_mtime_ns)
+            if touched:
+                if header['size'] != st.st_size or header['sha1'] != fileSha1(self.fileName):
+                    return False
+            body = f.read()
+        with gcPaused():
+            try:
+                errLines, extraWords, cats = pickle.loads(body)
+            except (pickle.UnpicklingError,EOFError,ValueError,AttributeError,ImportError,IndexError,TypeError):
+                return False
+            catDict = LDictCatDict({})
+            index = {}
+            for c, desc, words in cats:
+                catDict.catDict[c] = (desc,set(words))
+                for w in words:
+                    if w in index:
+                        index[w].add(c)
+                    else:
+                        index[w] = {c}
+            catDict.setWordIndex(index)
+            wordSet = set(index)
+            wordSet.update(extraWords)
+        self.errLines, self.wordSet, self.catDict = errLines, wordSet, catDict
+        if touched:
+            header['mtime'] = st.st_mtime_ns
+            with open(cacheFile,'wb') as f:
+                pickle.dump(header,f,pickle.HIGHEST_PROTOCOL)
+                f.write(body)
+        return True
     def LDictPrint(self):
         """Prints components of a dictionary"""
         print(self.fileName)
         print(self.wordSet)
         self.catDict.Lprint()
     def LDictRestoreWS(self):
-        """Re-creates dictionary wordset from the categories"""
+        """Re-creates dictionary wordset from the categories (when it is next read, inside a batch)"""
+        if self.batchLevel:
+            self.wordSetStale = True
+            return
         self.wordSet = self.catDict.getAllWords()
+    def LDictSave(self, cacheFile, encoding='utf-8'):
+        """Saves the parsed dictionary (categories, words and unhandled lines) to a cache file for LDictLoad
+        
+        Each category is stored as a sorted list of its words; the word index 
+        and the wordset are rebuilt from these when the cache is loaded.
+        """
+        st = os.stat(self.fileName)
+        header = {'format':dictCacheFormat,'fileName':os.path.abspath(self.fileName),'encoding':encoding,
+                  'size':st.st_size,'mtime':st.st_mtime_ns,'sha1':fileSha1(self.fileName)}
+        with open(cacheFile,'wb') as f:
+            pickle.dump(header,f,pickle.HIGHEST_PROTOCOL)
+            cats = [(c,self.catDict.getDesc(c),sorted(self.catDict.getWords(c))) for c in self.catDict.catDict]
+            extraWords = sorted(self.wordSet.difference(self.catDict.wordIndex))
+            pickle.dump((self.errLines,extraWords,cats),f,pickle.HIGHEST_PROTOCOL)
+    def LDictSnapshot(self):
+        """Returns a copy of the dictionary that can be changed independently, as a cheap alternative to deepcopy
+        
+        The copy shares the category wordsets, the word index and the wordset 
+        with the dictionary; a category wordset is copied only when it is first 
+        changed in place (in either dictionary), the word index when the first 
+        word is added or dropped. LDictCompare skips the categories whose 
+        wordsets are still shared.
+        """
+        LDnew = LDict('',cacheSize=self.cacheSize,tokenizer=self.tokenizer)
+        LDnew.fileName = self.fileName
+        LDnew.errLines = list(self.errLines)
+        LDnew.catDict = self.catDict.snapshot()
+        LDnew.wordSet = self.wordSet
+        return LDnew
     def LDictSubset(self,listcat):
         """Returns a new dictionary containing only selected lists categories from a given dictionary """
         LDnew = LDict('')
@@ -673,10 +1761,8 @@ class LDict:
                         for h in LDmodel.catDict.LDictHierarchies():
                             if h[1] == str(c):
                                 self.LDictEmptyCat(h[0],LDmodel)
-                        self.LDictRestoreWS()
                     if mode == 'replace':
                         self.LDictEmptyCat(c,LDmodel)
-                        self.LDictRestoreWS()
             else:
                 if updatetype == 'addfile':
                     if row[1].find(' ') > -1:
@@ -716,33 +1802,78 @@ class LDict:
         self.LDictRestoreWS()
         report.LDictURPrint()
     def LDictWrite(self,outFile,encoding='utf-8'):
-        """Very simple dictionary print"""
+        """Very simple dictionary print, written line by line"""
         if os.path.isfile(outFile):
             print(outFile,' already exists!')
             return
-        outStr = '%\n'
-        outStr += self.catDict.getCatLines()
-        outStr += '%\n'
-        outStr += self.catDict.getWordLines()
-        dictFile= open(outFile,'w',encoding=encoding)
-        dictFile.write(outStr)
-        dictFile.close
+        with open(outFile,'w',encoding=encoding) as dictFile:
+            dictFile.write('%\n')
+            dictFile.write(self.catDict.getCatLines())
+            dictFile.write('%\n')
+            dictFile.writelines(self.catDict.iterWordLines())
 
 
 class LDictCatDict:
-    """LIWC dictionary category list"""
+    """LIWC dictionary category list
+    
+    Besides the category dict (id -> (description, wordset)) the object keeps
+    wordIndex, which maps each word to the set of ids of the categories that 
+    contain it. The index is maintained by the methods below, so category 
+    wordsets should be changed through these methods, not directly. starTrie 
+    holds the wildcard entries of the index; it is built on first use (see 
+    getStarTrie) and None until then.
+    
+    After snapshot(), sharedCats maps the ids of the categories whose wordsets 
+    are shared with other category lists to a share count (a list [n] held by 
+    all of them), and indexShare is the share count of the word index (None if 
+    it is not shared). ownWords and ownIndex give up the share before a wordset 
+    or the index is changed in place, and copy it only if another category 
+    list still holds it; the last holder changes it without copying.
+    
+    fingerprints maps each category id to the sum of the hashes of its words, 
+    so that catDictDiff can skip unchanged categories. It is computed on first 
+    use (see getFingerprint) and then kept up to date by indexWord and 
+    unindexWord; it is None until then.
+    """
     def __init__(self, catDict):
         """Creates empty dictionary category list"""
         self.catDict = {}
+        self.wordIndex = {}
+        self.starTrie = None
+        self.version = 0
+        self.hierarchyCache = None
+        self.sharedCats = {}
+        self.indexShare = None
+        self.fingerprints = {}
+    def __setstate__(self, state):
+        """Restores a pickled (or copied) category list; the fingerprints are recomputed when needed, as string hashes differ between processes"""
+        self.__dict__.update(state)
+        self.sharedCats = {}
+        self.indexShare = None
+        self.fingerprints = None
     def addCat(self, id, desc, wordSet):
         """Adds new category with id, description and wordset into category dict"""
-        self.catDict[str(int(id))]=tuple([desc,wordSet])
+        id = str(int(id))
+        if id in self.catDict:
+            for w in self.catDict[id][1]:
+                self.unindexWord(id,w)
+        self.catDict[id]=tuple([desc,set(wordSet)])
+        self.releaseWords(id)
+        self.version += 1
+        for w in wordSet:
+            self.indexWord(id,w)
     def addWord(self, id, word):
         """Add word into existing category"""
-        self.catDict[str(int(id))][1].add(word)
+        id = str(int(id))
+        if word not in self.catDict[id][1]:
+            self.ownWords(id).add(word)
+            self.indexWord(id,word)
     def addWordSet(self, id, wordSet):
         """Adds set of words to existing category"""
+        for w in wordSet - self.getWords(id):
+            self.indexWord(str(int(id)),w)
         self.catDict[str(int(id))] = (self.getDesc(id),self.getWords(id) | wordSet)
+        self.releaseWords(str(int(id)))
 # was         self.catDict[id]=tuple([desc,wordSet])
     def catDictCatList(self,cat,dirname):
         """Creates a list of words for a category in a given directory on disk"""
@@ -758,58 +1889,70 @@ class LDictCatDict:
             self.catDictCatList(c,dirname)
     def catDictCompare(self,newCatDict):
         """Does and prints simple category dictionary compare"""
+        self.catDictDiff(newCatDict).LDictDRPrint()
+    def catDictDiff(self,newCatDict,report=None):
+        """Returns an LDictDiffReport (report, if given) holding the differences between two category lists
+        
+        Categories whose wordsets are the same object (see LDict.LDictSnapshot) 
+        or have the same size and fingerprint are taken to be unchanged without 
+        comparing their words.
+        """
+        if report is None:
+            report = LDictDiffReport()
         co = self.getDictCatSet()
         cn = newCatDict.getDictCatSet()
         if co != cn:
-            print('Old categories not in new dict: (',len(co - cn),')')
             for k in co - cn:
-                print (k,self.getDesc(k),len(self.getWords(k)),'words')
-            print('New categories not in old dict: (',len(cn - co),')')
+                report.removedCats[k] = (self.getDesc(k),len(self.getWords(k)))
             for k in cn - co:
-                print (k,newCatDict.getDesc(k),len(newCatDict.getWords(k)),'words')
-        else:
-            print('Same categories in use')
-        samedescs = True
-        for k in co & cn:
+                report.addedCats[k] = (newCatDict.getDesc(k),len(newCatDict.getWords(k)))
+        common = co & cn
+        for k in common:
             if self.getDesc(k) != newCatDict.getDesc(k):
-                samedescs = False
-                print('Category changed description: ',k,self.getDesc(k),newCatDict.getDesc(k))
-        if samedescs == True:
-            print('Same categories (if any) have same descriptions')
-        samewordsincats = True
-        for k in co & cn:
-            if self.getWords(k) != newCatDict.getWords(k):
-                samewordsincats = False
-                print('Category with changed words:',k,self.getDesc(k),newCatDict.getDesc(k))
-                print('Removed words:',len(self.getWords(k) - newCatDict.getWords(k)), self.getWords(k) - newCatDict.getWords(k))
-                print('Added words:',len(newCatDict.getWords(k) - self.getWords(k)), newCatDict.getWords(k) - self.getWords(k))
-        if samewordsincats == True:
-            print('Same words in corresponding categories (if any)')
+                report.changedDescs[k] = (self.getDesc(k),newCatDict.getDesc(k))
+        for k in common:
+            old = self.getWords(k)
+            new = newCatDict.getWords(k)
+            if old is new or (len(old) == len(new) and self.getFingerprint(k) == newCatDict.getFingerprint(k)):
+                continue
+            if old != new:
+                report.changedCats[k] = (self.getDesc(k),newCatDict.getDesc(k),old - new,new - old)
+        return report
     def dropCat(self,cat,LDmodel):
         """Removes a category from the dictionary and removes its words from the categories that it is included in"""
         for h in LDmodel.catDict.LDictHierarchies():
             if h[0] == str(cat):
                 self.dropWordSet(h[1],self.getWords(h[0]))
+        for w in self.catDict[str(cat)][1]:
+            self.unindexWord(str(cat),w)
         del(self.catDict[str(cat)])
+        self.releaseWords(str(cat))
+        if self.fingerprints is not None:
+            self.fingerprints.pop(str(cat),None)
+        self.version += 1
     def dropWord(self, id, word):
         """Drops a word from a category"""
-        self.catDict[str(int(id))][1].discard(word)
+        id = str(int(id))
+        if word in self.catDict[id][1]:
+            self.ownWords(id).discard(word)
+            self.unindexWord(id,word)
     def dropWordAllCats(self, word):
         """Drops a word from all categories"""
         for cat in self.getCatSet(word):
-            self.catDict[cat][1].discard(word)
+            self.ownWords(cat).discard(word)
+            self.unindexWord(cat,word)
     def emptyCat(self,cat,LDmodel):
         """Empties a category from the dictionary and removes its words from the categories that it is included in"""
         for h in LDmodel.catDict.LDictHierarchies():
             if h[0] == str(cat):
                 self.dropWordSet(h[1],self.getWords(h[0]))
+        for w in self.getWords(cat):
+            self.unindexWord(str(int(cat)),w)
         self.catDict[str(int(cat))] = (self.getDesc(cat),set())
+        self.releaseWords(str(int(cat)))
     def getAllWords(self):
         """Returns all words from a dictionary"""
-        ws = set()
-        for c in self.catDict:
-            ws = ws | self.catDict[c][1]
-        return ws
+        return set(self.wordIndex)
     def getDesc(self, id):
         """Returns the description of a category"""
         return self.catDict[str(int(id))][0]
@@ -834,28 +1977,15 @@ class LDictCatDict:
         return r
     def getCatSet(self, word):
         """Returns a set containing all category id's of the categories that contain a word"""
-        cs = set()
-        for c in self.catDict:
-            if word in self.catDict[c][1]:
-                if c not in cs:
-                    cs.add(c)
-        return cs
+        return set(self.wordIndex.get(word,()))
     def getCatSetStarred(self, word):
         """Returns a set containing all category id's of the categories that would retrun a hit for the word taking into account the wildcards"""
-        cs = set()
-        for c in self.catDict:
-            if word in self.catDict[c][1]:
-                if c not in cs:
-                    cs.add(c)
-        if not cs:
-            for i in range(len(word), 1, -1):
-                for c in self.catDict:
-                    if word[0:i]+'*' in self.catDict[c][1]:
-                        if c not in cs:
-                            cs.add(c)
-                if cs:
-                    break
-        return cs
+        if word in self.wordIndex:
+            return set(self.wordIndex[word])
+        entry = self.getStarTrie().longest(word)
+        if entry is not None:
+            return set(self.wordIndex[entry])
+        return set()
     def getDictCatSet(self):
         """Returns a set containing al category ids from a dictionary """
         cs = set()
@@ -864,45 +1994,162 @@ class LDictCatDict:
         return cs
     def getWordLines(self):
         """Creates string containing a line for each word in the dict, with the categories that it is included in"""
-        outStr = ""
-        for w in sorted(self.getAllWords(),key=str.lower):
-            outStr += w
-            for c in sorted(self.getCatSet(w),key=lambda a:(int(a))):
-                outStr += "\t"
-                outStr += str(c)
-            outStr += "\n"
-        return outStr
+        return ''.join(self.iterWordLines())
+    def iterWordLines(self):
+        """Generates a line for each word in the dict, with the categories that it is included in, using the word index"""
+        for w in sorted(self.wordIndex,key=str.lower):
+            yield w + ''.join(['\t' + c for c in sorted(self.wordIndex[w],key=lambda a:(int(a)))]) + '\n'
     def getWords(self, id):
         """Returns the words in a category"""
         return self.catDict[str(int(id))][1]
     def dropWordSet(self, id, wordSet):
         """Remove a set of words from a category"""
+        for w in self.getWords(id) & wordSet:
+            self.unindexWord(str(int(id)),w)
         self.catDict[str(int(id))] = (self.getDesc(id),self.getWords(id) - wordSet)
+        self.releaseWords(str(int(id)))
+    def snapshot(self):
+        """Returns a copy of the category list that shares the wordsets and the word index with this one until they are changed"""
+        new = LDictCatDict({})
+        new.catDict = dict(self.catDict)
+        new.wordIndex = self.wordIndex
+        new.starTrie = self.starTrie
+        new.version = self.version
+        new.hierarchyCache = self.hierarchyCache
+        if self.fingerprints is not None:
+            new.fingerprints = dict(self.fingerprints)
+        else:
+            new.fingerprints = None
+        for c in self.catDict:
+            share = self.sharedCats.get(c)
+            if share is None:
+                share = self.sharedCats[c] = [1]
+            share[0] += 1
+        new.sharedCats = dict(self.sharedCats)
+        if self.indexShare is None:
+            self.indexShare = [1]
+        self.indexShare[0] += 1
+        new.indexShare = self.indexShare
+        return new
+    def releaseWords(self, id):
+        """Gives up the share in the wordset of category id; returns True if another category list still holds it"""
+        share = self.sharedCats.pop(id,None)
+        if share is None:
+            return False
+        share[0] -= 1
+        return share[0] > 0
+    def ownWords(self, id):
+        """Returns the wordset of category id for changing in place, after copying it if another category list shares it"""
+        if self.releaseWords(id):
+            self.catDict[id] = (self.catDict[id][0],set(self.catDict[id][1]))
+        return self.catDict[id][1]
+    def releaseIndex(self):
+        """Gives up the share in the word index; returns True if another category list still holds it"""
+        share = self.indexShare
+        if share is None:
+            return False
+        self.indexShare = None
+        share[0] -= 1
+        return share[0] > 0
+    def ownIndex(self):
+        """Copies the word index and the trie of wildcard entries if another category list shares them"""
+        if self.releaseIndex():
+            self.wordIndex = {w:set(cs) for w, cs in self.wordIndex.items()}
+            self.starTrie = None
+    def indexWord(self, id, word):
+        """Registers in the word index that category id contains word"""
+        if self.indexShare is not None:
+            self.ownIndex()
+        self.version += 1
+        if self.fingerprints is not None:
+            self.fingerprints[id] = self.fingerprints.get(id,0) + hash(word)
+        if word in self.wordIndex:
+            self.wordIndex[word].add(id)
+        else:
+            self.wordIndex[word] = {id}
+            if self.starTrie is not None and word[-1:] == '*':
+                self.starTrie.add(word)
+    def unindexWord(self, id, word):
+        """Removes category id from the word index entry of word"""
+        if self.indexShare is not None:
+            self.ownIndex()
+        cs = self.wordIndex.get(word)
+        self.version += 1
+        if cs is not None and id in cs:
+            if self.fingerprints is not None:
+                self.fingerprints[id] -= hash(word)
+            cs.discard(id)
+            if not cs:
+                del self.wordIndex[word]
+                if self.starTrie is not None and word[-1:] == '*':
+                    self.starTrie.discard(word)
+    def rebuildIndex(self):
+        """Rebuilds the word index from the category wordsets (needed only if wordsets were changed directly)"""
+        index = {}
+        for c in self.catDict:
+            for w in self.catDict[c][1]:
+                cs = index.get(w)
+                if cs is None:
+                    index[w] = {c}
+                else:
+                    cs.add(c)
+        self.setWordIndex(index)
+    def setWordIndex(self, index):
+        """Installs a word index (word -> set of category ids) that was built in bulk from the current wordsets"""
+        self.releaseIndex()
+        self.wordIndex = index
+        self.starTrie = None
+        self.fingerprints = None
+        self.version += 1
+    def getFingerprint(self, id):
+        """Returns the sum of the hashes of the words in category id, computing the fingerprints of all categories if necessary"""
+        if self.fingerprints is None:
+            self.fingerprints = {c:sum(map(hash,self.catDict[c][1])) for c in self.catDict}
+        return self.fingerprints.get(id,0)
+    def getStarTrie(self):
+        """Returns the trie of the wildcard entries in the word index, building it if necessary"""
+        if self.starTrie is None:
+            starTrie = LDictPrefixTrie()
+            for w in self.wordIndex:
+                if w[-1:] == '*':
+                    starTrie.add(w)
+            self.starTrie = starTrie
+        return self.starTrie
     def LDictHierarchies(self):
-        """Creates a list of pairs of (included cat, including cat)"""
+        """Creates a list of pairs of (included cat, including cat)
+        
+        The result is cached until the dictionary changes.
+        """
+        if self.hierarchyCache is not None and self.hierarchyCache[0] == self.version:
+            return list(self.hierarchyCache[1])
+        cats = [(c,self.catDict[c][1],len(self.catDict[c][1])) for c in self.catDict]
         l = []
-        for s2 in self.catDict:
-            for s1 in self.catDict:
-                if (len(self.catDict[s1][1]) > 0) & (len(self.catDict[s1][1]) < len(self.catDict[s2][1])):
-                    if self.catDict[s1][1] < self.catDict[s2][1]:
+        for s2, w2, n2 in cats:
+            for s1, w1, n1 in cats:
+                if (n1 > 0) & (n1 < n2):
+                    if w1 < w2:
                         l.append((s1,s2))
-        return l
+        self.hierarchyCache = (self.version,l,None)
+        return list(l)
     def LDictExtraHierarchicalWords(self,inclusions):
-        """Creates a dictionary of extracategorical words (words not in included categories) for all categories that have included categories"""
-        tl = set()
+        """Creates a dictionary of extracategorical words (words not in included categories) for all categories that have included categories
+        
+        The result for the dictionary's own hierarchies is cached with them.
+        """
+        cached = self.hierarchyCache is not None and self.hierarchyCache[0] == self.version and self.hierarchyCache[1] == inclusions
+        if cached and self.hierarchyCache[2] is not None:
+            return self.hierarchyCache[2]
+        tl = {}
         for i in inclusions:
             if i[1] not in tl:
-                tl.add(i[1])
+                tl[i[1]] = []
+            tl[i[1]].append(i[0])
         LDictEHW = {}
         for t in tl:
-            lwl = set()
-            for i in inclusions:
-                if t == i[1]:
-                    lwl = lwl | self.getWords(i[0])
-#            print(t,self.getDesc(t))
-            r = self.getWords(t)-lwl
-#            print(len(r), r)
-            LDictEHW[t]=r
+            lwl = set().union(*[self.getWords(c) for c in tl[t]])
+            LDictEHW[t]=self.getWords(t)-lwl
+        if cached:
+            self.hierarchyCache = (self.version,self.hierarchyCache[1],LDictEHW)
         return LDictEHW
     def Lprint(self):
         """Prints catdict object"""
@@ -928,43 +2175,44 @@ class LDictCatDict:
         return r
     def htmlDivList(self):
         """Prints the catagories in the dictionary html print"""
-        r = ''
+        return ''.join(self.htmlDivChunks())
+    def htmlDivChunks(self):
+        """Generates the html of the categories in the dictionary html print, one category at a time"""
         h = self.LDictHierarchies()
         ehw = self.LDictExtraHierarchicalWords(h)
-#        print(ehw)
         s = sorted(self.catDict.keys(),key=lambda a:(int(a)))
         for cat in s:
-#            print(cat)
-            r += '\n<a href="#top">top</a>\n<div id="'
-            r += cat
-            r += '">\n<h2>Category '
-            r += cat
-            r += ', '
-            r += self.catDict[cat][0]
-            r += '</h2>\n<p>Number of words: '
-            r += str(len(self.catDict[cat][1]))
-            r += '</p>\n<p>'
+            r = []
+            r.append('\n<a href="#top">top</a>\n<div id="')
+            r.append(cat)
+            r.append('">\n<h2>Category ')
+            r.append(cat)
+            r.append(', ')
+            r.append(self.catDict[cat][0])
+            r.append('</h2>\n<p>Number of words: ')
+            r.append(str(len(self.catDict[cat][1])))
+            r.append('</p>\n<p>')
             if str(cat) in ehw:
-                r += '</h2>\n<p>Number of extrahierarchical words: '
-                r += str(len(ehw[str(cat)]))
-                r += '</p>\n<p style="font-weight:bold">Extrahierarchical words:</p>\n<p>'
+                r.append('</h2>\n<p>Number of extrahierarchical words: ')
+                r.append(str(len(ehw[str(cat)])))
+                r.append('</p>\n<p style="font-weight:bold">Extrahierarchical words:</p>\n<p>')
                 firstletter = ''
                 for w in sorted(ehw[str(cat)]):
                     if w[0:1] != firstletter:
                         firstletter = w[0:1]
-                        r += "<span style='color:red;font-weight:bold'>"+firstletter+"</span> "
-                    r += w
-                    r += ' '
-                r += '</p>\n<p style="font-weight:bold">All words:</p>\n<p>'
+                        r.append("<span style='color:red;font-weight:bold'>"+firstletter+"</span> ")
+                    r.append(w)
+                    r.append(' ')
+                r.append('</p>\n<p style="font-weight:bold">All words:</p>\n<p>')
             firstletter = ''
             for w in sorted(self.catDict[cat][1]):
                 if w[0:1] != firstletter:
                     firstletter = w[0:1]
-                    r += "<span style='color:red;font-weight:bold'>"+firstletter+"</span> "
+                    r.append("<span style='color:red;font-weight:bold'>"+firstletter+"</span> ")
                 if (str(cat) not in ehw) or ((str(cat) in ehw) and (w in ehw[str(cat)])):
-                    r += w
+                    r.append(w)
                 else:
-                    r += "<span class='noehw'>"+w+"</span>"
-                r += ' '
-            r += '</p></div>'
-        return r
+                    r.append("<span class='noehw'>"+w+"</span>")
+                r.append(' ')
+            r.append('</p></div>')
+            yield ''.join(r)
@@ -0,0 +1,238 @@
+"""Benchmarks for LIWCtools
+
+Generates synthetic LIWC dictionaries and corpora in a temporary directory and
+times the main code paths at several scales, reporting throughput and peak
+(traced) memory. Runs offline; the generated texts are UTF-8, so chardet is not
+needed.
+
+Usage:
+    python benchmarks/benchmark.py                          # all scales
+    python benchmarks/benchmark.py --scale small
+    python benchmarks/benchmark.py --save baseline.json     # save results as baseline
+    python benchmarks/benchmark.py --baseline baseline.json # compare with baseline
+
+When comparing, a benchmark that is more than --tolerance (default 25%) slower
+than in the baseline is reported as a regression and the exit status is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from LIWCtools.LIWCtools import LDict, LDictMatch
+
+scales = {
+    'small': {'cats': 20, 'words': 2000, 'wildcards': 0.2, 'depth': 2, 'files': 5, 'tokens': 20000, 'wordlist': 10000},
+    'medium': {'cats': 70, 'words': 10000, 'wildcards': 0.2, 'depth': 3, 'files': 10, 'tokens': 100000, 'wordlist': 100000},
+    'large': {'cats': 100, 'words': 50000, 'wildcards': 0.2, 'depth': 4, 'files': 20, 'tokens': 250000, 'wordlist': 500000},
+}
+
+letters = 'abcdefghijklmnopqrstuvwxyz'
+
+def randomWord(rnd):
+    """Returns a random lower-case word of 2 to 10 letters"""
+    return ''.join(rnd.choice(letters) for _ in range(rnd.randint(2, 10)))
+
+def makeDictionary(fileName, cats, words, wildcards, depth, seed=1):
+    """Writes a synthetic LIWC dictionary
+
+    The categories form chains of depth categories, each including the words of
+    the next one, so the dictionary has hierarchies. Some entries are also put in
+    the head of another chain, which keeps the chains intact. A fraction
+    wildcards of the entries end in '*'. Returns the list of entries.
+    """
+    rnd = random.Random(seed)
+    entries = {}
+    while len(entries) < words:
+        w = randomWord(rnd)
+        if rnd.random() < wildcards:
+            w += '*'
+        entries[w] = {rnd.randint(1, cats)}
+    for w in entries:
+        c = next(iter(entries[w]))
+        while (c - 1) % depth != 0:
+            c -= 1
+            entries[w].add(c)
+        if rnd.random() < 0.3:
+            entries[w].add(rnd.randrange(1, cats + 1, depth))
+    with open(fileName, 'w', encoding='utf-8') as f:
+        f.write('%\n')
+        for c in range(1, cats + 1):
+            f.write('%d\tcat%d\n' % (c, c))
+        f.write('%\n')
+        for w in entries:
+            f.write(w + '\t' + '\t'.join(str(c) for c in sorted(entries[w])) + '\n')
+    return list(entries)
+
+def makeCorpus(dirName, entries, files, tokens, seed=2):
+    """Writes files text files of tokens words each and returns their names
+
+    About half of the tokens are (expansions of) dictionary entries, the rest are
+    random words, some of them capitalized or contractions.
+    """
+    rnd = random.Random(seed)
+    stems = [w.rstrip('*') for w in entries]
+    names = []
+    for i in range(files):
+        toks = []
+        for _ in range(tokens):
+            r = rnd.random()
+            if r < 0.5:
+                toks.append(rnd.choice(stems) + (randomWord(rnd)[:2] if rnd.random() < 0.2 else ''))
+            elif r < 0.55:
+                toks.append(rnd.choice(["it's", "don't", "we'll", "I'm", "The"]))
+            else:
+                toks.append(randomWord(rnd))
+            if rnd.random() < 0.05:
+                toks[-1] += '.\n'
+        name = os.path.join(dirName, 'text%d.txt' % i)
+        with open(name, 'w', encoding='utf-8') as f:
+            f.write(' '.join(toks))
+        names.append(name)
+    return names
+
+def makeWordList(entries, size, seed=3):
+    """Returns a word list (e.g. a frequency list) for LDictExpand"""
+    rnd = random.Random(seed)
+    stems = [w.rstrip('*') for w in entries]
+    return [rnd.choice(stems) + randomWord(rnd)[:rnd.randint(0, 3)] for _ in range(size)]
+
+def makeMatchFile(fileName, cats):
+    """Writes a dictionary match file that maps each category onto itself"""
+    with open(fileName, 'w') as f:
+        f.write('old number;old description;new number;new description;;comment\n')
+        for c in range(1, cats + 1):
+            f.write('%d;cat%d;%d;cat%d;;\n' % (c, c, c, c))
+
+def measure(fn, repeat=1):
+    """Runs fn and returns (best wall-clock time of repeat runs, peak traced memory in bytes)"""
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t = time.perf_counter()
+            fn()
+            t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def quietDict(fileName):
+    """Reads a dictionary without printing"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return LDict(fileName)
+
+def runScale(name, p, workDir, repeat):
+    """Runs all benchmarks for one scale and returns a dict of results"""
+    d = os.path.join(workDir, name)
+    os.makedirs(d)
+    dicName = os.path.join(d, 'bench.dic')
+    entries = makeDictionary(dicName, p['cats'], p['words'], p['wildcards'], p['depth'])
+    files = makeCorpus(d, entries, p['files'], p['tokens'])
+    wordList = makeWordList(entries, p['wordlist'])
+    matchName = os.path.join(d, 'match.csv')
+    makeMatchFile(matchName, p['cats'])
+    with open(files[0], encoding='utf-8') as f:
+        text = f.read()
+    ntokens = p['files'] * p['tokens']
+    LD = quietDict(dicName)
+    if p['depth'] > 1:
+        assert LD.catDict.LDictHierarchies(), 'benchmark dictionary has no hierarchies'
+    LD2 = quietDict(dicName)
+    for w in wordList[:p['words'] // 10]:
+        LD2.catDict.addWord(1, w)
+    LD2.LDictRestoreWS()
+    def count():
+        LD.LDictCount(files)
+    def hierarchies():
+        LD.catDict.hierarchyCache = None
+        LD.catDict.LDictHierarchies()
+    def html():
+        LD.catDict.hierarchyCache = None
+        LD.LDictHtml(os.path.join(d, 'dict.html'))
+    def htmlView():
+        LD.catDict.hierarchyCache = None
+        LD2.catDict.hierarchyCache = None
+        LDictMatch(matchName).HtmlView(os.path.join(d, 'view.html'), LD, LD2)
+    def expand():
+        quietDict(dicName).LDictExpand(wordList)
+    def write():
+        out = os.path.join(d, 'out.dic')
+        if os.path.exists(out):
+            os.remove(out)
+        LD.LDictWrite(out)
+    def countString():
+        LD.compile()
+        LD.cachedLookup.cache_clear()
+        LD.LDictCountString(text)
+    benchmarks = [
+        ('LDict.__init__', lambda: LDict(dicName), p['words'], 'words/s'),
+        ('LDictCountString', countString, p['tokens'], 'tokens/s'),
+        ('LDictCount', count, ntokens, 'tokens/s'),
+        ('LDictHierarchies', hierarchies, p['words'], 'words/s'),
+        ('LDictHtml', html, p['words'], 'words/s'),
+        ('LDictMatch.HtmlView', htmlView, p['words'], 'words/s'),
+        ('LDictExpand', expand, p['wordlist'], 'words/s'),
+        ('LDictWrite', write, p['words'], 'words/s'),
+    ]
+    results = {}
+    for label, fn, units, unitName in benchmarks:
+        t, peak = measure(fn, repeat)
+        results[label] = {'seconds': t, 'throughput': units / t if t > 0 else 0, 'unit': unitName, 'peak_bytes': peak}
+        print('%-8s %-22s %10.4f s %14.0f %-9s %10.1f MB' % (name, label, t, results[label]['throughput'], unitName, peak / 1e6))
+    return results
+
+def compare(results, baseline, tolerance):
+    """Prints the comparison with a baseline and returns the number of regressions"""
+    regressions = 0
+    for scale in results:
+        for label in results[scale]:
+            if scale not in baseline or label not in baseline[scale]:
+                continue
+            old = baseline[scale][label]['seconds']
+            new = results[scale][label]['seconds']
+            ratio = new / old if old > 0 else 1
+            status = 'ok'
+            if ratio > 1 + tolerance:
+                status = 'REGRESSION'
+                regressions += 1
+            print('%-8s %-22s %10.4f s -> %10.4f s (%5.2fx) %s' % (scale, label, old, new, ratio, status))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for LIWCtools')
+    parser.add_argument('--scale', choices=sorted(scales), action='append', help='scale(s) to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs per benchmark (best is reported)')
+    parser.add_argument('--save', help='save the results as a baseline (json)')
+    parser.add_argument('--baseline', help='compare the results with a saved baseline (json)')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown relative to the baseline')
+    args = parser.parse_args()
+    workDir = tempfile.mkdtemp(prefix='liwcbench')
+    results = {}
+    try:
+        for name in args.scale or ['small', 'medium', 'large']:
+            results[name] = runScale(name, scales[name], workDir, args.repeat)
+    finally:
+        shutil.rmtree(workDir)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
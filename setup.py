@@ -79,7 +79,8 @@ setup(
     # for example:
     # $ pip install -e .[dev,test]
     extras_require={
-        'count': ['chardet']
+        'count': ['chardet'],
+        'numpy': ['numpy'],
     },
 
     # If there are data files included in your packages that need to be